@@ -0,0 +1,6 @@
+from bench.suite import main
+
+import sys
+
+
+sys.exit(main(sys.argv[1:]))
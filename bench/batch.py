@@ -0,0 +1,53 @@
+from kates import parser, runner
+from kates.batch import batched, run_batch
+from kates.program import Program
+
+import timeit
+from typing import Dict, List
+
+
+def damage(runner: runner.Runner, args) -> str:
+    return str(int(args[0]) - int(args[1]))
+
+
+@batched
+def batched_damage(runners: List[runner.Runner], args) -> List[str]:
+    return [str(int(attack) - int(armor)) for attack, armor in args]
+
+
+def make_program(function, calls: int) -> Program:
+    code = '\n'.join(f'v{i} = damage $attack {i}' for i in range(calls))
+    return Program({'damage': function}, runner.Script(parser.parse(code)))
+
+
+def make_variable_sets(count: int) -> List[Dict[str, str]]:
+    return [{'attack': str(i)} for i in range(count)]
+
+
+def run_each(program: Program, variable_sets: List[Dict[str, str]]):
+    for variables in variable_sets:
+        spawned = program.spawn()
+        spawned.variables.update(variables)
+        spawned.run()
+
+
+def measure(function, repeat: int = 5) -> float:
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    calls = 20
+    variable_sets = make_variable_sets(2000)
+    plain = make_program(damage, calls)
+    batch = make_program(batched_damage, calls)
+    steps = calls * len(variable_sets)
+    for name, function in [
+        ('spawn().run() each', lambda: run_each(plain, variable_sets)),
+        ('run_batch, plain function', lambda: run_batch(plain, variable_sets)),
+        ('run_batch, batched function', lambda: run_batch(batch, variable_sets)),
+    ]:
+        print(f'{name + ":":<30} {steps / measure(function):>12.0f} steps/s')
+
+
+if __name__ == '__main__':
+    main()
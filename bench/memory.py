@@ -0,0 +1,44 @@
+from bench.parse import make_code
+from kates import parser, runner
+from kates.program import Program
+
+import tracemalloc
+
+
+def make_functions(count: int):
+    return {f'game.function_{i}': runner.builtin_nop for i in range(count)}
+
+
+def measure(create, count: int) -> float:
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    runners = [create() for _ in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del runners
+    return size / count
+
+
+def measure_corpus(scripts: int, lines: int) -> float:
+    # Memory of the parsed commands of a corpus of generated scripts, which
+    # use the same function names, variable names and literals
+    codes = [make_code(lines, seed=i) for i in range(scripts)]
+    return measure(lambda: parser.parse(codes.pop()), scripts) / lines
+
+
+def main():
+    count = 10000
+    functions = make_functions(50)
+    code = '\n'.join(f'v{i} = game.function_{i}' for i in range(10))
+    script = runner.Script(parser.parse(code))
+    program = Program(functions, script)
+
+    legacy = measure(lambda: runner.Runner(functions, script), count)
+    shared = measure(program.spawn, count)
+    print(f'Runner(functions, script): {legacy:>8.0f} bytes/runner')
+    print(f'Program.spawn():           {shared:>8.0f} bytes/runner')
+    print(f'Parsed script corpus:      {measure_corpus(200, 500):>8.0f} bytes/command')
+
+
+if __name__ == '__main__':
+    main()
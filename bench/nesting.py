@@ -0,0 +1,60 @@
+from kates.runner import *
+
+import timeit
+from typing import Dict
+
+
+class StackRunner(Runner):
+    def __init__(self, functions: Dict[str, FunctionType], script: Script):
+        super().__init__(functions, script)
+        self._no_execution_stack = [False]
+
+    def push_no_execution_state(self, state: bool):
+        self._no_execution_stack.append(state)
+
+    def pop_no_execution_state(self):
+        if len(self._no_execution_stack) <= 1:
+            raise StrayEndifError()
+        self._no_execution_stack.pop()
+
+    def get_no_execution_state(self):
+        return any(self._no_execution_stack)
+
+    def switch_no_execution_state(self):
+        self._no_execution_stack[-1] = not self._no_execution_stack[-1]
+
+    def should_execute(self) -> bool:
+        return not self.get_no_execution_state()
+
+
+def make_script(depth: int, body: int) -> Script:
+    return Script(
+        [If(PlainCommand('true', []))] * depth
+        + [PlainCommand('nop', [])] * body
+        + [Endif()] * depth
+    )
+
+
+def measure(runner_class, script: Script, repeat: int) -> float:
+    functions = {'true': lambda r, a: '1'}
+    steps = len(script.commands)
+    seconds = min(timeit.repeat(
+        lambda: runner_class(functions, script).run(),
+        number=1,
+        repeat=repeat,
+    ))
+    return seconds / steps * 1e9
+
+
+def main():
+    body = 10000
+    print(f'{"depth":>6} {"stack, ns/step":>16} {"counter, ns/step":>18}')
+    for depth in (1, 16, 64, 256, 1024):
+        script = make_script(depth, body)
+        stack = measure(StackRunner, script, repeat=5)
+        counter = measure(Runner, script, repeat=5)
+        print(f'{depth:>6} {stack:>16.1f} {counter:>18.1f}')
+
+
+if __name__ == '__main__':
+    main()
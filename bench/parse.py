@@ -0,0 +1,45 @@
+from kates import parser
+
+import random
+import shlex
+import timeit
+
+
+def make_code(lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    templates = [
+        'player.disable_controls',
+        'glow_sprite = game.spawn_sprite "technical/effects/glow" {} {}',
+        'game.wait_for_death $glow_sprite',
+        'say "Hello, {}! It\'s a \\"nice\\" day" \'{}\'',
+        'if == $x {}',
+        'else',
+        'endif',
+        '',
+        'x = id $$literal{}',
+    ]
+    return '\n'.join(
+        rng.choice(templates).format(rng.randrange(100), rng.randrange(100))
+        for _ in range(lines)
+    )
+
+
+def throughput(function, argument, count: int, repeat: int = 5) -> float:
+    seconds = min(timeit.repeat(lambda: function(argument), number=1, repeat=repeat))
+    return count / seconds
+
+
+def main():
+    code = make_code(20000)
+    lines = code.split('\n')
+
+    def split_all(split):
+        return lambda lines: [split(line) for line in lines]
+
+    print(f'shlex.split:        {throughput(split_all(shlex.split), lines, len(lines)):>12.0f} lines/s')
+    print(f'parser.split_line:  {throughput(split_all(parser.split_line), lines, len(lines)):>12.0f} lines/s')
+    print(f'parser.parse:       {throughput(parser.parse, code, len(lines)):>12.0f} lines/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+from kates import compiler, loader, parser, runner
+from bench.parse import make_code
+
+import os
+import tempfile
+import time
+
+
+def main():
+    files = 500
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(files):
+            path = os.path.join(directory, f'{i}.kates')
+            with open(path, 'w') as f:
+                f.write(make_code(200, seed=i))
+            paths.append(path)
+
+        start = time.perf_counter()
+        for path in paths:
+            with open(path) as f:
+                compiler.compile_script(runner.Script(parser.parse(f.read())))
+        parsing = time.perf_counter() - start
+
+        for path in paths:
+            loader.load_script(path)
+
+        start = time.perf_counter()
+        for path in paths:
+            loader.load_script(path)
+        cached = time.perf_counter() - start
+
+    print(f'{files} scripts, parsing:    {parsing * 1000:>8.1f} ms')
+    print(f'{files} scripts, from cache: {cached * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+from kates import loader, parser, runner
+from kates.batch import run_batch
+from kates.program import Program
+from kates.scheduler import Scheduler
+from bench.batch import batched_damage, make_program as make_batch_program, make_variable_sets
+from bench.memory import make_functions, measure as measure_memory, measure_corpus
+from bench.nesting import make_script as make_nested_script
+from bench.parse import make_code
+from bench.variables import make_code as make_variables_code
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# name -> (function returning the measured value, unit, whether higher is better)
+Benchmark = Tuple[Callable[[], float], str, bool]
+benchmarks: Dict[str, Benchmark] = {}
+
+
+def benchmark(unit: str, higher_is_better: bool):
+    def register(function: Callable[[], float]) -> Callable[[], float]:
+        benchmarks[function.__name__] = (function, unit, higher_is_better)
+        return function
+    return register
+
+
+def best_time(function: Callable[[], object], repeat: int = 7) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def steps_per_second(program: Program, steps: int) -> float:
+    return steps / best_time(lambda: program.spawn().run())
+
+
+@benchmark('lines/s', True)
+def parse_throughput() -> float:
+    code = make_code(20000)
+    return 20000 / best_time(lambda: parser.parse(code))
+
+
+@benchmark('steps/s', True)
+def flat_script() -> float:
+    code = '\n'.join(f'game.function_{i % 50} {i} foo' for i in range(20000))
+    return steps_per_second(Program(make_functions(50), runner.Script(parser.parse(code))), 20000)
+
+
+@benchmark('steps/s', True)
+def deep_nesting() -> float:
+    script = make_nested_script(256, 10000)
+    program = Program({'true': lambda r, a: '1'}, script)
+    return steps_per_second(program, len(script.commands))
+
+
+@benchmark('steps/s', True)
+def deep_nesting_interpreted() -> float:
+    script = make_nested_script(256, 10000)
+    functions = {'true': lambda r, a: '1'}
+    return len(script.commands) / best_time(lambda: runner.Runner(functions, script).run())
+
+
+@benchmark('steps/s', True)
+def variables() -> float:
+    code = make_variables_code(100, 20000)
+    return steps_per_second(Program({}, runner.Script(parser.parse(code))), 20100)
+
+
+@benchmark('steps/s', True)
+def builtins() -> float:
+    code = '\n'.join(['a = id 1', 'b = id 2'] + [
+        line
+        for _ in range(5000)
+        for line in ('x = == $a $b', 'y = != $x 1', 'z = id $y', 'if == $z 1', 'endif')
+    ])
+    return steps_per_second(Program({}, runner.Script(parser.parse(code))), 25002)
+
+
+@benchmark('steps/s', True)
+def batched_calls() -> float:
+    # 2000 runners making 20 calls each to a batched function
+    program = make_batch_program(batched_damage, 20)
+    variable_sets = make_variable_sets(2000)
+    return 40000 / best_time(lambda: run_batch(program, variable_sets), repeat=5)
+
+
+@benchmark('ms/tick', False)
+def paused_runners() -> float:
+    # 10000 runners wait for their own events, 100 of them are woken each tick
+    scheduler = Scheduler()
+    program = Program(scheduler.functions, runner.Script(parser.parse('wait $event\nwait $event\nwait $event')))
+    for i in range(10000):
+        paused = program.spawn()
+        paused.variables['event'] = str(i)
+        scheduler.add(paused)
+    scheduler.tick()
+
+    def tick():
+        for i in range(100):
+            scheduler.notify(str(i))
+        scheduler.tick()
+
+    return best_time(tick, repeat=2) * 1000
+
+
+@benchmark('bytes/runner', False)
+def runner_memory() -> float:
+    code = '\n'.join(f'v{i} = game.function_{i}' for i in range(10))
+    program = Program(make_functions(50), runner.Script(parser.parse(code)))
+    return measure_memory(program.spawn, 10000)
+
+
+@benchmark('bytes/command', False)
+def script_memory() -> float:
+    return measure_corpus(200, 500)
+
+
+@benchmark('ms', False)
+def cold_start() -> float:
+    # Loading 200 scripts from the compiled-script cache
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(200):
+            path = os.path.join(directory, f'{i}.kates')
+            with open(path, 'w') as f:
+                f.write(make_code(200, seed=i))
+            paths.append(path)
+            loader.load_script(path)
+
+        def load():
+            for path in paths:
+                loader.load_script(path)
+
+        return best_time(load) * 1000
+
+
+def run(names: List[str]) -> Dict[str, float]:
+    results = {}
+    for name in names:
+        function, unit, _ = benchmarks[name]
+        results[name] = function()
+        print(f'{name:<28} {results[name]:>16.3f} {unit}', flush=True)
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> List[str]:
+    regressions = []
+    for name, value in results.items():
+        if name not in baseline:
+            continue
+        _, unit, higher_is_better = benchmarks[name]
+        change = value / baseline[name] - 1
+        if not higher_is_better:
+            change = -change
+        status = 'ok'
+        if change < -tolerance:
+            status = 'REGRESSION'
+            regressions.append(name)
+        print(f'{name:<28} {baseline[name]:>16.3f} -> {value:>16.3f} {unit:<14} {change:>+7.1%}  {status}')
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    arguments = argparse.ArgumentParser(description='KateScript benchmark suite')
+    arguments.add_argument('names', nargs='*', help='benchmarks to run (all by default)')
+    arguments.add_argument('--baseline', default=BASELINE_PATH, help='baseline file')
+    arguments.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    arguments.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help='relative slowdown reported as a regression (default: 0.2)',
+    )
+    options = arguments.parse_args(argv)
+
+    names = options.names or list(benchmarks)
+    unknown = [name for name in names if name not in benchmarks]
+    if len(unknown) != 0:
+        arguments.error(f'unknown benchmarks: {", ".join(unknown)}')
+
+    results = run(names)
+    if options.save:
+        with open(options.baseline, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+            f.write('\n')
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print(f'No baseline at {options.baseline}; use --save to create it')
+        return 0
+    with open(options.baseline) as f:
+        baseline = json.load(f)
+    print()
+    regressions = compare(results, baseline, options.tolerance)
+    return 1 if len(regressions) != 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
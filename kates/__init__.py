@@ -1,5 +1,18 @@
+from . import batch
+from . import compiler
+from . import loader
+from . import pack
 from . import parser
+from . import pool
+from . import profiler
+from . import program
 from . import runner
+from . import scheduler
+from . import serialization
+from . import snapshot
+from . import streaming
+from . import symbols
+from . import tracing
 
 
-__all__ = ['parser', 'runner']
+__all__ = ['batch', 'compiler', 'loader', 'pack', 'parser', 'pool', 'profiler', 'program', 'runner', 'scheduler', 'serialization', 'snapshot', 'streaming', 'symbols', 'tracing']
@@ -0,0 +1,148 @@
+from . import compiler
+from .error import Error
+from .program import Program
+from .runner import Command, ExecutionStopReason, Runner, ScriptExecutionError
+
+import heapq
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+
+BatchedFunctionType = Callable[[List[Runner], List[Sequence[str]]], List[str]]
+
+
+class BatchResultsError(Error):
+    def __init__(self, expected: int, returned: int):
+        super().__init__(f'Batched function returned {returned} results for {expected} runners')
+        self.expected = expected
+        self.returned = returned
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return (self.expected, self.returned) == (other.expected, other.returned)
+
+
+class BatchedFunction:
+    # Called by a single runner, the function gets a batch of one. run_batch
+    # instead calls it once for all runners at the same command
+    def __init__(self, function: BatchedFunctionType):
+        self.function = function
+
+    def __call__(self, runner: Runner, args: Sequence[str]) -> str:
+        return self.function([runner], [args])[0]
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return self.function == other.function
+
+    def __hash__(self) -> int:
+        return hash(self.function)
+
+    def __repr__(self) -> str:
+        return f'BatchedFunction({self.function})'
+
+
+def batched(function: BatchedFunctionType) -> BatchedFunction:
+    return BatchedFunction(function)
+
+
+def batched_call(command: Command) -> Optional[compiler.BoundCommand]:
+    # The call of a batched function made by `command`, when run_batch can
+    # make it for all runners at once and finish the command with the results
+    kind = type(command)
+    if kind is compiler.BoundCommand:
+        call = command
+    elif kind is compiler.AssignCall or kind is compiler.SlotAssignment or kind is compiler.BranchUnless:
+        call = command.command
+    else:
+        return None
+    if type(call) is compiler.BoundCommand and type(call.function) is BatchedFunction:
+        return call
+    return None
+
+
+def _run_call(command: Command, call: compiler.BoundCommand, runners: List[Runner]):
+    arguments: List[Sequence[str]] = []
+    for runner in runners:
+        runner.command_index += 1
+        values = call.values
+        if call.evaluated:
+            values = list(values)
+            try:
+                for position, argument in call.evaluated:
+                    values[position] = argument.evaluate(runner)
+            except Exception as e:
+                raise ScriptExecutionError(e, runner) from e
+        arguments.append(values)
+
+    # Errors of the batched function are reported for the first runner
+    try:
+        results = call.function.function(runners, arguments)
+        if len(results) != len(runners):
+            raise BatchResultsError(len(runners), len(results))
+    except Exception as e:
+        raise ScriptExecutionError(e, runners[0]) from e
+
+    if isinstance(command, compiler.SlotAssignment):
+        slot = command.slot
+        for runner, result in zip(runners, results):
+            if runner._shared_slots:
+                runner.own_variable_slots()
+            runner.variable_slots[slot] = result
+    elif type(command) is compiler.BranchUnless:
+        for runner, result in zip(runners, results):
+            if result == '0' or result == '':
+                runner.command_index = command.target
+
+
+def run_batch(
+    program: Program,
+    variable_sets: Sequence[Mapping[str, str]],
+) -> List[Tuple[Runner, ExecutionStopReason]]:
+    runners = []
+    for variables in variable_sets:
+        runner = program.spawn()
+        runner.variables.update(variables)
+        runners.append(runner)
+
+    results: Dict[int, ExecutionStopReason] = {}
+    commands = program.script.commands
+    calls = [batched_call(command) for command in commands]
+
+    # Runners waiting at the same command are stepped together. The lowest
+    # command goes first, so runners which took different branches get back
+    # in step once the branches join
+    groups: Dict[int, List[int]] = {}
+    positions: List[int] = []
+
+    def place(index: int):
+        runner = runners[index]
+        if runner.execution_stop_reason is not None:
+            results[index], runner.execution_stop_reason = runner.execution_stop_reason, None
+            return
+        if runner.command_index >= len(commands):
+            results[index] = ExecutionStopReason('end')
+            return
+        group = groups.get(runner.command_index)
+        if group is None:
+            group = groups[runner.command_index] = []
+            heapq.heappush(positions, runner.command_index)
+        group.append(index)
+
+    for index in range(len(runners)):
+        place(index)
+
+    while len(positions) != 0:
+        position = heapq.heappop(positions)
+        group = groups.pop(position)
+        call = calls[position]
+        if call is None:
+            for index in group:
+                runners[index].run_single_command()
+        else:
+            _run_call(commands[position], call, [runners[index] for index in group])
+        for index in group:
+            place(index)
+
+    return [(runners[index], results[index]) for index in range(len(runners))]
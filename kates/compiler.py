@@ -0,0 +1,476 @@
+from . import runner
+from .error import Error
+from .runner import NoSuchVariableError, unset
+from .symbols import symbol_table
+
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class UnresolvedFunctionsError(Error):
+    def __init__(self, locations: Dict[str, List[int]]):
+        details = ', '.join(
+            f'{repr(name)} (commands {", ".join(map(str, indices))})'
+            for name, indices in locations.items()
+        )
+        super().__init__(f'No such functions: {details}')
+        self.function_names = list(locations)
+        self.locations = locations
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return self.locations == other.locations
+
+
+class SlotArgument(runner.VariableArgument):
+    __slots__ = ('slot',)
+
+    def __init__(self, variable_name: str, slot: int):
+        super().__init__(variable_name)
+        self.slot = slot
+
+    def evaluate(self, runner: 'runner.Runner') -> str:
+        value = runner.variable_slots[self.slot]
+        if value is unset:
+            raise NoSuchVariableError(self.variable_name)
+        return value
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return (self.variable_name, self.slot) == (other.variable_name, other.slot)
+
+    def __repr__(self) -> str:
+        return f'SlotArgument({self.variable_name} at {self.slot})'
+
+
+class SlotAssignment(runner.Assignment):
+    __slots__ = ('slot',)
+
+    def __init__(self, variable_name: str, slot: int, command: runner.Command):
+        super().__init__(variable_name, command)
+        self.slot = slot
+
+    def run(self, runner: 'runner.Runner') -> str:
+        result = self.command.run(runner)
+        if runner._shared_slots:
+            runner.own_variable_slots()
+        runner.variable_slots[self.slot] = result
+        return result
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return (self.variable_name, self.slot, self.command) == (other.variable_name, other.slot, other.command)
+
+    def __repr__(self) -> str:
+        return f'SlotAssignment({self.variable_name} at {self.slot} = {self.command})'
+
+
+class BoundCommand(runner.PlainCommand):
+    __slots__ = ('function',)
+
+    def __init__(self, function_name: str, arguments: List[runner.Argument], function: runner.FunctionType):
+        super().__init__(function_name, arguments)
+        self.function = function
+
+    def run(self, runner: 'runner.Runner') -> str:
+        arguments = self.values
+        if self.evaluated:
+            arguments = list(arguments)
+            for position, argument in self.evaluated:
+                arguments[position] = argument.evaluate(runner)
+        return self.function(runner, arguments)
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return (self.function_name, self.arguments, self.function) == (other.function_name, other.arguments, other.function)
+
+    def __repr__(self) -> str:
+        return f'BoundCommand({self.function_name} of {self.arguments})'
+
+
+class BranchUnless(runner.Command):
+    __slots__ = ('command', 'target')
+
+    def __init__(self, command: runner.Command, target: int):
+        self.command = command
+        self.target = target
+
+    def run(self, runner: 'runner.Runner') -> str:
+        result = self.command.run(runner)
+        if result == '0' or result == '':
+            runner.command_index = self.target
+        return ''
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return (self.command, self.target) == (other.command, other.target)
+
+    def __repr__(self) -> str:
+        return f'BranchUnless({self.command} else to {self.target})'
+
+
+class Jump(runner.Command):
+    __slots__ = ('target',)
+
+    def __init__(self, target: int):
+        self.target = target
+
+    def run(self, runner: 'runner.Runner') -> str:
+        runner.command_index = self.target
+        return ''
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return self.target == other.target
+
+    def __repr__(self) -> str:
+        return f'Jump({self.target})'
+
+
+class Pass(runner.Command):
+    __slots__ = ()
+
+    def run(self, runner: 'runner.Runner') -> str:
+        del runner
+        return ''
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other)
+
+    def __repr__(self) -> str:
+        return f'Pass'
+
+
+PASS = Pass()
+
+
+class Constant(runner.Command):
+    __slots__ = ('value',)
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def run(self, runner: 'runner.Runner') -> str:
+        del runner
+        return self.value
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return self.value == other.value
+
+    def __repr__(self) -> str:
+        return f'Constant({repr(self.value)})'
+
+
+class BranchUnlessEquals(BranchUnless):
+    # `if == $variable literal` and `if != $variable literal` bound to the
+    # builtins, without calling them
+    __slots__ = ('variable_name', 'slot', 'value', 'equal')
+
+    def __init__(self, command: BoundCommand, target: int):
+        super().__init__(command, target)
+        variable, literal = command.arguments
+        if type(variable) is not SlotArgument:
+            variable, literal = literal, variable
+        self.variable_name = variable.variable_name
+        self.slot = variable.slot
+        self.value = literal.value
+        self.equal = command.function is runner.builtin_equals
+
+    def run(self, runner: 'runner.Runner') -> str:
+        value = runner.variable_slots[self.slot]
+        if value is unset:
+            raise NoSuchVariableError(self.variable_name)
+        if (value == self.value) is not self.equal:
+            runner.command_index = self.target
+        return ''
+
+
+class CopySlot(SlotAssignment):
+    # `x = id $y` bound to the builtin
+    __slots__ = ('source_name', 'source_slot')
+
+    def __init__(self, variable_name: str, slot: int, command: BoundCommand):
+        super().__init__(variable_name, slot, command)
+        self.source_name = command.arguments[0].variable_name
+        self.source_slot = command.arguments[0].slot
+
+    def run(self, runner: 'runner.Runner') -> str:
+        result = runner.variable_slots[self.source_slot]
+        if result is unset:
+            raise NoSuchVariableError(self.source_name)
+        if runner._shared_slots:
+            runner.own_variable_slots()
+        runner.variable_slots[self.slot] = result
+        return result
+
+
+class AssignCall(SlotAssignment):
+    __slots__ = ('function', 'values', 'evaluated')
+
+    def __init__(self, variable_name: str, slot: int, command: BoundCommand):
+        super().__init__(variable_name, slot, command)
+        self.function = command.function
+        self.values = command.values
+        self.evaluated = command.evaluated
+
+    def run(self, runner: 'runner.Runner') -> str:
+        arguments = self.values
+        if self.evaluated:
+            arguments = list(arguments)
+            for position, argument in self.evaluated:
+                arguments[position] = argument.evaluate(runner)
+        result = self.function(runner, arguments)
+        if runner._shared_slots:
+            runner.own_variable_slots()
+        runner.variable_slots[self.slot] = result
+        return result
+
+
+class CompiledScript(runner.Script):
+    def __init__(self, commands: Sequence[runner.Command], variable_names: Sequence[str] = ()):
+        super().__init__(commands)
+        self.variable_names = tuple(map(symbol_table.intern, variable_names))
+        self.variable_indices = {name: index for index, name in enumerate(self.variable_names)}
+
+    def __repr__(self) -> str:
+        return f'CompiledScript({self.commands})'
+
+
+def transform(command: runner.Command, function: Callable[[runner.Command], runner.Command]) -> runner.Command:
+    # Applies `function` to the command and to every command nested in it,
+    # innermost first. Fused instructions are rebuilt unfused
+    kind = type(command)
+    if kind is runner.Assignment:
+        command = runner.Assignment(command.variable_name, transform(command.command, function))
+    elif isinstance(command, SlotAssignment):
+        command = SlotAssignment(command.variable_name, command.slot, transform(command.command, function))
+    elif kind is runner.If:
+        command = runner.If(transform(command.command, function))
+    elif isinstance(command, BranchUnless):
+        command = BranchUnless(transform(command.command, function), command.target)
+    return function(command)
+
+
+def with_arguments(command: runner.PlainCommand, arguments: List[runner.Argument]) -> runner.PlainCommand:
+    if type(command) is BoundCommand:
+        return BoundCommand(command.function_name, arguments, command.function)
+    return runner.PlainCommand(command.function_name, arguments)
+
+
+def uncompiled(command: runner.Command) -> runner.Command:
+    # The inverse of compile_script for a single command: every `if`, `else`
+    # and matched `endif` is compiled to one instruction
+    if isinstance(command, BranchUnless):
+        return runner.If(command.command)
+    if type(command) is Jump:
+        return runner.ELSE
+    if type(command) is Pass:
+        return runner.ENDIF
+    return command
+
+
+def compile_script(script: runner.Script) -> CompiledScript:
+    if isinstance(script, CompiledScript):
+        return script
+
+    commands = script.commands
+    result: List[runner.Command] = list(commands)
+
+    def set_target(index: int, target: int):
+        command = commands[index]
+        if isinstance(command, runner.If):
+            result[index] = BranchUnless(command.command, target)
+        else:
+            result[index] = Jump(target)
+
+    def resolve(toggles: List[int], end: int):
+        # Each `if` or `else` switches the branch state, so when one of them
+        # is executed, control continues right after the next switch point
+        for current, following in zip(toggles, toggles[1:]):
+            set_target(current, following + 1)
+        if len(toggles) != 0:
+            set_target(toggles[-1], end)
+
+    # frames[0] collects stray top-level `else`s, which switch the base state
+    frames: List[List[int]] = [[]]
+    for index, command in enumerate(commands):
+        if isinstance(command, runner.If):
+            frames.append([index])
+        elif isinstance(command, runner.Else):
+            frames[-1].append(index)
+        elif isinstance(command, runner.Endif):
+            if len(frames) > 1:
+                resolve(frames.pop(), index + 1)
+                result[index] = PASS
+            else:
+                # A stray `endif` is kept as is, so it still raises
+                # StrayEndifError when it is reached
+                resolve(frames[0], index)
+                frames[0] = []
+
+    for toggles in frames:
+        resolve(toggles, len(commands))
+
+    return CompiledScript(result)
+
+
+def optimize(
+    script: runner.Script,
+    functions: Optional[Dict[str, runner.FunctionType]] = None,
+) -> runner.Script:
+    # Folds calls of pure functions on literals, drops calls whose results are
+    # not used and removes the branches of `if`s with constant conditions.
+    # Command indices change, so errors point to optimized commands, not to
+    # source lines. Compiled scripts are optimized with their branches turned
+    # back into `if`/`else`/`endif`, and compiled again
+    functions = runner.make_function_table(functions or {})
+
+    def fold(command: runner.Command) -> runner.Command:
+        kind = type(command)
+        if kind is BoundCommand:
+            function = command.function
+        elif kind is runner.PlainCommand:
+            function = functions.get(command.function_name)
+        else:
+            return command
+        if function is None or not runner.is_pure(function):
+            return command
+        if any(type(argument) is not runner.LiteralArgument for argument in command.arguments):
+            return command
+        try:
+            return Constant(symbol_table.intern(function(None, command.values)))
+        except Exception:
+            # The error is raised when the command is run instead
+            return command
+
+    result: List[runner.Command] = []
+    # One entry per open `if`: None when the condition is not constant,
+    # whether the current branch is kept when it is, and `skipped` for `if`s
+    # inside removed branches
+    skipped = object()
+    frames: List[object] = []
+    # The number of open constant `if`s whose current branch is removed
+    removed = 0
+    for command in map(uncompiled, script.commands):
+        kind = type(command)
+        if kind is runner.If:
+            if removed != 0:
+                frames.append(skipped)
+                continue
+            condition = fold(command.command)
+            if type(condition) is not Constant:
+                frames.append(None)
+                result.append(runner.If(condition))
+                continue
+            kept = condition.value != '0' and condition.value != ''
+            frames.append(kept)
+            if not kept:
+                removed += 1
+        elif kind is runner.Else or kind is runner.Endif:
+            frame = frames[-1] if len(frames) != 0 else None
+            if frame is None:
+                # Stray commands and the ones of other `if`s are kept
+                result.append(command)
+            elif frame is not skipped:
+                if not frame:
+                    removed -= 1
+                if kind is runner.Else:
+                    frames[-1] = not frame
+                    if frame:
+                        removed += 1
+            if kind is runner.Endif and len(frames) != 0:
+                frames.pop()
+        elif removed == 0:
+            command = transform(command, fold)
+            if type(command) is not Constant:
+                result.append(command)
+
+    if isinstance(script, CompiledScript):
+        return CompiledScript(compile_script(runner.Script(result)).commands, script.variable_names)
+    return runner.Script(result)
+
+
+def link(script: runner.Script, functions: Dict[str, runner.FunctionType]) -> CompiledScript:
+    functions = runner.make_function_table(functions)
+    locations: Dict[str, List[int]] = {}
+
+    def link_command(command: runner.Command, index: int) -> runner.Command:
+        kind = type(command)
+        if kind is runner.PlainCommand or kind is BoundCommand:
+            function = functions.get(command.function_name)
+            if function is None:
+                locations.setdefault(command.function_name, []).append(index + 1)
+                return command
+            return BoundCommand(command.function_name, command.arguments, function)
+        return command
+
+    script = compile_script(script)
+    result = [
+        transform(command, lambda command: link_command(command, index))
+        for index, command in enumerate(script.commands)
+    ]
+    if len(locations) != 0:
+        raise UnresolvedFunctionsError(locations)
+    return CompiledScript(result, script.variable_names)
+
+
+def allocate_variables(script: runner.Script) -> CompiledScript:
+    script = compile_script(script)
+    if len(script.variable_names) != 0:
+        return script
+
+    slots: Dict[str, int] = {}
+
+    def allocate(command: runner.Command) -> runner.Command:
+        kind = type(command)
+        if kind is runner.Assignment:
+            slot = slots.setdefault(command.variable_name, len(slots))
+            return SlotAssignment(command.variable_name, slot, command.command)
+        if kind is runner.PlainCommand or kind is BoundCommand:
+            arguments = [
+                SlotArgument(
+                    argument.variable_name,
+                    slots.setdefault(argument.variable_name, len(slots)),
+                ) if type(argument) is runner.VariableArgument else argument
+                for argument in command.arguments
+            ]
+            return with_arguments(command, arguments)
+        return command
+
+    result = [transform(command, allocate) for command in script.commands]
+    return CompiledScript(result, tuple(slots))
+
+
+def fuse(script: CompiledScript) -> CompiledScript:
+    # Replaces common patterns of linked scripts with allocated variables by
+    # single instructions, saving the nested `run` calls
+    def fuse_command(command: runner.Command) -> runner.Command:
+        kind = type(command)
+        if kind is BranchUnless:
+            condition = command.command
+            if (
+                type(condition) is BoundCommand
+                and (condition.function is runner.builtin_equals or condition.function is runner.builtin_not_equals)
+                and len(condition.arguments) == 2
+                and {type(argument) for argument in condition.arguments} == {SlotArgument, runner.LiteralArgument}
+            ):
+                return BranchUnlessEquals(condition, command.target)
+        elif kind is SlotAssignment and type(command.command) is BoundCommand:
+            call = command.command
+            if (
+                call.function is runner.builtin_id
+                and len(call.arguments) == 1
+                and type(call.arguments[0]) is SlotArgument
+            ):
+                return CopySlot(command.variable_name, command.slot, call)
+            return AssignCall(command.variable_name, command.slot, call)
+        return command
+
+    return CompiledScript(list(map(fuse_command, script.commands)), script.variable_names)
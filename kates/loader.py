@@ -0,0 +1,91 @@
+from . import compiler
+from . import parser
+from . import runner
+from . import serialization
+
+import hashlib
+import os
+import struct
+from typing import Optional, Tuple
+
+
+CACHE_MAGIC = b'KATC'
+CACHE_FORMAT_VERSION = 2
+CACHE_SUFFIX = 'c'
+
+# magic, format version, source mtime (ns), source size, source digest
+_HEADER = struct.Struct('<4sHqQ16s')
+
+
+def cache_path(path: str) -> str:
+    return os.fspath(path) + CACHE_SUFFIX
+
+
+def source_digest(source: bytes) -> bytes:
+    return hashlib.blake2b(source, digest_size=16).digest()
+
+
+def _read_cache(path: str) -> Optional[Tuple[int, int, bytes, bytes]]:
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, mtime, size, digest = _HEADER.unpack_from(data)
+    if magic != CACHE_MAGIC or version != CACHE_FORMAT_VERSION:
+        return None
+    return mtime, size, digest, data[_HEADER.size:]
+
+
+def _write_cache(path: str, stat: os.stat_result, digest: bytes, payload: bytes):
+    header = _HEADER.pack(CACHE_MAGIC, CACHE_FORMAT_VERSION, stat.st_mtime_ns, stat.st_size, digest)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary_path, 'wb') as f:
+            f.write(header + payload)
+        os.replace(temporary_path, path)
+    except OSError:
+        # Like with .pyc files, failing to write the cache is not an error
+        try:
+            os.unlink(temporary_path)
+        except OSError:
+            pass
+
+
+def _decode(payload: bytes) -> Optional[compiler.CompiledScript]:
+    try:
+        script = serialization.loads(payload)
+    except serialization.SerializationError:
+        return None
+    if not isinstance(script, compiler.CompiledScript):
+        return None
+    return script
+
+
+def load_script(path: str) -> compiler.CompiledScript:
+    path = os.fspath(path)
+    stat = os.stat(path)
+    cache_file = cache_path(path)
+    cache = _read_cache(cache_file)
+    if cache is not None:
+        mtime, size, digest, payload = cache
+        if (mtime, size) == (stat.st_mtime_ns, stat.st_size):
+            script = _decode(payload)
+            if script is not None:
+                return script
+
+    with open(path, 'rb') as f:
+        source = f.read()
+    digest = source_digest(source)
+    if cache is not None and cache[2] == digest:
+        script = _decode(cache[3])
+        if script is not None:
+            # The source was touched, but not changed
+            _write_cache(cache_file, stat, digest, cache[3])
+            return script
+
+    script = compiler.compile_script(runner.Script(parser.parse(source.decode())))
+    _write_cache(cache_file, stat, digest, serialization.dumps(script))
+    return script
@@ -0,0 +1,108 @@
+from . import compiler
+from . import parser
+from . import runner
+from .error import Error
+
+import marshal
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, Mapping, Tuple
+
+
+PACK_MAGIC = b'KATP'
+PACK_FORMAT_VERSION = 1
+
+# magic, format version, index size; the header is followed by the
+# marshalled index (name -> (offset, length)) and the UTF-8 sources
+_HEADER = struct.Struct('<4sHQ')
+
+
+class PackError(Error):
+    pass
+
+
+def write_pack(path: str, scripts: Mapping[str, str]):
+    sources = [(name, code.encode()) for name, code in scripts.items()]
+    index: Dict[str, Tuple[int, int]] = {}
+    offset = 0
+    for name, source in sources:
+        index[name] = (offset, len(source))
+        offset += len(source)
+    encoded_index = marshal.dumps(index)
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(PACK_MAGIC, PACK_FORMAT_VERSION, len(encoded_index)))
+        f.write(encoded_index)
+        for _, source in sources:
+            f.write(source)
+
+
+class Pack(Mapping[str, compiler.CompiledScript]):
+    # Only the index is read when the pack is opened. Sources are read from
+    # the memory-mapped file and compiled when a script is first requested
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise PackError('Pack is too short')
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, index_size = _HEADER.unpack_from(self._map)
+            if magic != PACK_MAGIC:
+                raise PackError('Not a script pack')
+            if version != PACK_FORMAT_VERSION:
+                raise PackError(f'Unsupported pack format version: {version}')
+            try:
+                self._index: Dict[str, Tuple[int, int]] = marshal.loads(
+                    self._map[_HEADER.size:_HEADER.size + index_size],
+                )
+            except (EOFError, ValueError, TypeError) as e:
+                raise PackError(f'Invalid pack index: {e}') from e
+        except BaseException:
+            self._map.close()
+            raise
+        self._data_offset = _HEADER.size + index_size
+        self._scripts: Dict[str, compiler.CompiledScript] = {}
+        self.path = os.fspath(path)
+
+    def source(self, name: str) -> str:
+        offset, length = self._index[name]
+        start = self._data_offset + offset
+        return self._map[start:start + length].decode()
+
+    def __getitem__(self, name: str) -> compiler.CompiledScript:
+        script = self._scripts.get(name)
+        if script is None:
+            try:
+                source = self.source(name)
+            except KeyError:
+                raise KeyError(name) from None
+            script = compiler.compile_script(runner.Script(parser.parse(source)))
+            self._scripts[name] = script
+        return script
+
+    def __contains__(self, name) -> bool:
+        return name in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def loaded_count(self) -> int:
+        return len(self._scripts)
+
+    def close(self):
+        self._scripts.clear()
+        self._map.close()
+
+    def __enter__(self) -> 'Pack':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f'Pack({self.path}, {len(self)} scripts, {self.loaded_count} loaded)'
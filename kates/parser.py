@@ -1,8 +1,12 @@
 from . import runner
 from .error import Error
+from .symbols import symbol_table
 
-import shlex
-from typing import List
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, Iterator, List
 
 
 class EmptyCommandError(Error):
@@ -22,12 +26,60 @@ class ParseError(Error):
         self.err = err
 
 
+_WORD = re.compile(r'[^ \t\r\n]+')
+_SPECIAL = re.compile(r'[\'"\\]')
+_SEGMENT = re.compile(r'''
+      (?P<plain>[^ \t\r\n'"\\]+)
+    | \\(?P<escaped>.)
+    | '(?P<single>[^']*)'
+    | "(?P<double>(?:[^"\\]|\\.)*)"
+    | (?P<space>[ \t\r\n]+)
+''', re.VERBOSE | re.DOTALL)
+_DOUBLE_QUOTED_ESCAPE = re.compile(r'\\(["\\])')
+_UNTERMINATED_ESCAPE = re.compile(r'"(?:[^"\\]|\\.)*\\\Z', re.DOTALL)
+
+
+def split_line(line: str) -> List[str]:
+    # Produces the same tokens as `shlex.split(line)`
+    if _SPECIAL.search(line) is None:
+        return _WORD.findall(line)
+
+    tokens: List[str] = []
+    parts: List[str] = []
+    quoted = False
+    position = 0
+    while position < len(line):
+        match = _SEGMENT.match(line, position)
+        if match is None:
+            if line[position] == '\\' or _UNTERMINATED_ESCAPE.match(line, position):
+                raise ValueError('No escaped character')
+            raise ValueError('No closing quotation')
+        position = match.end()
+
+        kind = match.lastgroup
+        if kind == 'space':
+            if len(parts) != 0 or quoted:
+                tokens.append(''.join(parts))
+                parts = []
+                quoted = False
+        elif kind == 'double':
+            parts.append(_DOUBLE_QUOTED_ESCAPE.sub(r'\1', match.group(kind)))
+            quoted = True
+        else:
+            parts.append(match.group(kind))
+            quoted = quoted or kind == 'single'
+
+    if len(parts) != 0 or quoted:
+        tokens.append(''.join(parts))
+    return tokens
+
+
 def parse_argument(token: str) -> runner.Argument:
     if token.startswith('$$'):
-        return runner.LiteralArgument(token[1:])
+        return runner.LiteralArgument(symbol_table.intern(token[1:]))
     if token.startswith('$'):
-        return runner.VariableArgument(token[1:])
-    return runner.LiteralArgument(token)
+        return runner.VariableArgument(symbol_table.intern(token[1:]))
+    return runner.LiteralArgument(symbol_table.intern(token))
 
 
 def parse_command(tokens: List[str]) -> runner.Command:
@@ -40,36 +92,106 @@ def parse_command(tokens: List[str]) -> runner.Command:
     if tokens[0] == 'else':
         if len(tokens) != 1:
             raise InvalidBuiltinCommandUsageError('else')
-        return runner.Else()
+        return runner.ELSE
     if tokens[0] == 'endif':
         if len(tokens) != 1:
             raise InvalidBuiltinCommandUsageError('endif')
-        return runner.Endif()
-    function_name = tokens[0]
+        return runner.ENDIF
+    function_name = symbol_table.intern(tokens[0])
     arguments = list(map(parse_argument, tokens[1:]))
     return runner.PlainCommand(function_name, arguments)
 
 
 def parse_line(line: str) -> runner.Command:
-    tokens = shlex.split(line)
+    tokens = split_line(line)
     if len(tokens) == 0:
-        return runner.PlainCommand('nop', [])
+        return runner.EMPTY_LINE
     if len(tokens) >= 2 and tokens[1] == '=':
-        variable_name = tokens[0]
+        variable_name = symbol_table.intern(tokens[0])
         command = parse_command(tokens[2:])
         return runner.Assignment(variable_name, command)
     return parse_command(tokens)
 
 
-def parse(code: str) -> List[runner.Command]:
-    result: List[runner.Command] = []
-    lines = code.split('\n')
+def iter_parse(lines: Iterable[str]) -> Iterator[runner.Command]:
+    # `lines` may be a file object or any other iterable of lines, with or
+    # without line terminators. As with `parse`, a trailing line terminator
+    # is followed by one more (empty) line
+    line_number = 0
+    ended_with_newline = True
+    for line_number, line in enumerate(lines, 1):
+        ended_with_newline = line.endswith('\n')
+        if ended_with_newline:
+            line = line[:-1]
+        try:
+            command = parse_line(line)
+        except Exception as e:
+            raise ParseError(line_number, e) from e
+        yield command
+    if ended_with_newline:
+        yield parse_line('')
 
-    i = 0
-    try:
-        for i, line in enumerate(lines):
-            result.append(parse_line(line))
-    except Exception as e:
-        raise ParseError(i + 1, e) from e
 
-    return result
+def parse(code: str) -> List[runner.Command]:
+    return list(iter_parse(code.split('\n')))
+
+
+class ParseCache:
+    def __init__(self, maxsize: int = 256):
+        if maxsize < 0:
+            raise ValueError('Cache size cannot be negative')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._scripts: 'OrderedDict[bytes, runner.Script]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(code: str) -> bytes:
+        return hashlib.blake2b(code.encode(), digest_size=16).digest()
+
+    def get(self, code: str) -> runner.Script:
+        key = self.key(code)
+        with self._lock:
+            script = self._scripts.get(key)
+            if script is not None:
+                self._scripts.move_to_end(key)
+                self.hits += 1
+                return script
+            self.misses += 1
+
+        script = runner.Script(tuple(parse(code)))
+        with self._lock:
+            self._scripts[key] = script
+            self._shrink()
+        return script
+
+    def resize(self, maxsize: int):
+        if maxsize < 0:
+            raise ValueError('Cache size cannot be negative')
+        with self._lock:
+            self.maxsize = maxsize
+            self._shrink()
+
+    def clear(self):
+        with self._lock:
+            self._scripts.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _shrink(self):
+        while len(self._scripts) > self.maxsize:
+            self._scripts.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._scripts)
+
+    def __repr__(self) -> str:
+        return f'ParseCache(size {len(self)}/{self.maxsize}, {self.hits} hits, {self.misses} misses)'
+
+
+parse_cache = ParseCache()
+
+
+def parse_cached(code: str) -> runner.Script:
+    return parse_cache.get(code)
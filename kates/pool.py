@@ -0,0 +1,101 @@
+from . import serialization
+from .error import Error
+from .program import Program
+from .runner import ExecutionStopReason, FunctionType, Script
+
+import importlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+
+class TaskError(Error):
+    def __init__(self, task_index: int, message: str):
+        super().__init__(f'Task {task_index} failed: {message}')
+        self.task_index = task_index
+        self.message = message
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return (self.task_index, self.message) == (other.task_index, other.message)
+
+
+def resolve_function(name: str) -> FunctionType:
+    # `name` looks like 'package.module:function' or 'package.module:Class.method'
+    module_name, _, attribute_path = name.partition(':')
+    result = importlib.import_module(module_name)
+    for attribute in attribute_path.split('.'):
+        result = getattr(result, attribute)
+    return result
+
+
+class _Worker:
+    def __init__(self, function_names: Mapping[str, str], scripts: Sequence[bytes]):
+        self.functions = {name: resolve_function(path) for name, path in function_names.items()}
+        self.scripts = scripts
+        self.programs: Dict[int, Program] = {}
+
+    def program(self, script_index: int) -> Program:
+        program = self.programs.get(script_index)
+        if program is None:
+            script = serialization.loads(self.scripts[script_index])
+            program = self.programs[script_index] = Program(self.functions, script)
+        return program
+
+
+_worker: Optional[_Worker] = None
+
+
+def _initialize_worker(function_names: Mapping[str, str], scripts: Sequence[bytes]):
+    global _worker
+    _worker = _Worker(function_names, scripts)
+
+
+def _run_task(task: Tuple[int, int, Mapping[str, str]]) -> Tuple[bool, object]:
+    # Errors are sent back as strings, since exceptions holding runners and
+    # host functions cannot be pickled
+    task_index, script_index, variables = task
+    try:
+        runner = _worker.program(script_index).spawn()
+        runner.variables.update(variables)
+        reason = runner.run()
+        return True, (reason, dict(runner.variables))
+    except Exception as e:
+        return False, (task_index, f'{type(e).__name__}: {e}')
+
+
+def run_many(
+    tasks: Sequence[Tuple[Script, Mapping[str, str]]],
+    function_names: Mapping[str, str],
+    processes: Optional[int] = None,
+    chunksize: Optional[int] = None,
+) -> List[Tuple[ExecutionStopReason, Dict[str, str]]]:
+    # Every distinct script is serialized once and sent to each worker when it
+    # starts; tasks only refer to scripts by index
+    script_indices: Dict[int, int] = {}
+    scripts: List[bytes] = []
+    encoded_tasks = []
+    for task_index, (script, variables) in enumerate(tasks):
+        script_index = script_indices.get(id(script))
+        if script_index is None:
+            script_index = script_indices[id(script)] = len(scripts)
+            scripts.append(serialization.dumps(script))
+        encoded_tasks.append((task_index, script_index, dict(variables)))
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(encoded_tasks) // (processes * 4))
+
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_initialize_worker,
+        initargs=(dict(function_names), scripts),
+    ) as executor:
+        results = []
+        for ok, result in executor.map(_run_task, encoded_tasks, chunksize=chunksize):
+            if not ok:
+                raise TaskError(*result)
+            results.append(result)
+    return results
@@ -0,0 +1,178 @@
+from . import compiler
+from . import runner
+from .runner import ExecutionStopReason, FunctionType, Runner
+
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+
+class Stats:
+    __slots__ = ('count', 'cumulative_time', 'self_time')
+
+    def __init__(self):
+        self.count = 0
+        self.cumulative_time = 0.0
+        self.self_time = 0.0
+
+    def __repr__(self) -> str:
+        return f'Stats({self.count} calls, {self.cumulative_time:.6f}s cumulative, {self.self_time:.6f}s self)'
+
+
+def describe(command: runner.Command) -> str:
+    kind = type(command)
+    if kind is runner.PlainCommand or kind is compiler.BoundCommand:
+        return command.function_name
+    if kind is runner.Assignment or isinstance(command, compiler.SlotAssignment):
+        return f'{command.variable_name} = {describe(command.command)}'
+    if kind is runner.If or isinstance(command, compiler.BranchUnless):
+        return f'if {describe(command.command)}'
+    if kind is runner.Else or kind is compiler.Jump:
+        return 'else'
+    if kind is runner.Endif or kind is compiler.Pass:
+        return 'endif'
+    if kind is compiler.Constant:
+        return repr(command.value)
+    return repr(command)
+
+
+class Profiler:
+    # Profiled runs go through Profiler.run, which swaps timed copies of the
+    # function table and of the compiled script into the runner for the
+    # duration of the run, so Runner.run itself is never instrumented
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.commands: Dict[Tuple[str, int], Stats] = {}
+        self.functions: Dict[str, Stats] = {}
+        self._labels: Dict[Tuple[str, int], str] = {}
+        self._command_functions: Dict[Tuple[str, int], Dict[str, float]] = {}
+        self._instrumented: Dict[int, Tuple[object, object]] = {}
+        self._function_name: Optional[str] = None
+        self._function_time = 0.0
+
+    def _time_function(self, name: str, function: FunctionType) -> FunctionType:
+        def timed(runner: Runner, args: Sequence[str]) -> str:
+            start = self.clock()
+            try:
+                return function(runner, args)
+            finally:
+                elapsed = self.clock() - start
+                stats = self.functions.get(name)
+                if stats is None:
+                    stats = self.functions[name] = Stats()
+                stats.count += 1
+                stats.cumulative_time += elapsed
+                stats.self_time += elapsed
+                self._function_name = name
+                self._function_time += elapsed
+        return timed
+
+    def _instrument(self, original):
+        # Instrumented copies are kept alive together with their originals,
+        # so the ids used as keys cannot be reused
+        cached = self._instrumented.get(id(original))
+        if cached is not None:
+            return cached[1]
+
+        if isinstance(original, dict):
+            result = {name: self._time_function(name, function) for name, function in original.items()}
+        elif isinstance(original, compiler.CompiledScript):
+            def time_bound(command: runner.Command) -> runner.Command:
+                if type(command) is compiler.BoundCommand:
+                    function = self._time_function(command.function_name, command.function)
+                    return compiler.BoundCommand(command.function_name, command.arguments, function)
+                return command
+
+            def instrument_command(command: runner.Command) -> runner.Command:
+                # Fused instructions are kept, so the profile measures the
+                # script which is actually run. Only AssignCall calls its
+                # function, the other ones never call the builtins they replace
+                kind = type(command)
+                if kind is compiler.AssignCall:
+                    return compiler.AssignCall(command.variable_name, command.slot, time_bound(command.command))
+                if kind is compiler.BranchUnlessEquals or kind is compiler.CopySlot:
+                    return command
+                return compiler.transform(command, time_bound)
+
+            commands = list(map(instrument_command, original.commands))
+            result = compiler.CompiledScript(commands, original.variable_names)
+            result._digest = original._digest
+        else:
+            result = original
+        self._instrumented[id(original)] = (original, result)
+        return result
+
+    def run(self, runner: Runner, name: str = 'script') -> ExecutionStopReason:
+        # Runners with their own run loop, such as streaming and traced
+        # runners, would be bypassed by the loop below
+        if type(runner).run is not Runner.run:
+            raise TypeError(f'{type(runner).__name__} cannot be profiled')
+        functions, script = runner.functions, runner.script
+        runner.functions = self._instrument(functions)
+        runner.script = self._instrument(script)
+        clock = self.clock
+        try:
+            while runner.command_index < len(script.commands):
+                index = runner.command_index
+                self._function_name = None
+                self._function_time = 0.0
+                start = clock()
+                try:
+                    runner.run_single_command()
+                finally:
+                    self._record(name, script, index, clock() - start)
+                if runner.execution_stop_reason is not None:
+                    reason, runner.execution_stop_reason = runner.execution_stop_reason, None
+                    return reason
+            return ExecutionStopReason('end')
+        finally:
+            runner.functions, runner.script = functions, script
+
+    def _record(self, name: str, script: runner.Script, index: int, elapsed: float):
+        key = (name, index)
+        stats = self.commands.get(key)
+        if stats is None:
+            stats = self.commands[key] = Stats()
+            self._labels[key] = describe(script.commands[index])
+            self._command_functions[key] = {}
+        stats.count += 1
+        stats.cumulative_time += elapsed
+        stats.self_time += elapsed - self._function_time
+        if self._function_name is not None:
+            times = self._command_functions[key]
+            times[self._function_name] = times.get(self._function_name, 0.0) + self._function_time
+
+    def report(self, limit: Optional[int] = None) -> str:
+        lines = [f'{"calls":>10} {"cumulative":>12} {"self":>12}  command']
+        commands = sorted(self.commands.items(), key=lambda item: item[1].cumulative_time, reverse=True)
+        for (name, index), stats in commands[:limit]:
+            label = self._labels[name, index]
+            lines.append(
+                f'{stats.count:>10} {stats.cumulative_time:>12.6f} {stats.self_time:>12.6f}'
+                f'  {name}:{index + 1}: {label}'
+            )
+        lines.append('')
+        lines.append(f'{"calls":>10} {"cumulative":>12} {"self":>12}  function')
+        functions = sorted(self.functions.items(), key=lambda item: item[1].cumulative_time, reverse=True)
+        for function_name, stats in functions[:limit]:
+            lines.append(
+                f'{stats.count:>10} {stats.cumulative_time:>12.6f} {stats.self_time:>12.6f}  {function_name}'
+            )
+        return '\n'.join(lines)
+
+    def collapsed(self) -> str:
+        # The collapsed stack format of flamegraph.pl, with microseconds as
+        # sample counts
+        lines = []
+        for (name, index), stats in self.commands.items():
+            frame = f'{name};{index + 1}: {self._labels[name, index]}'.replace(' ', '_')
+            lines.append(f'{frame} {round(stats.self_time * 1e6)}')
+            for function_name, elapsed in self._command_functions[name, index].items():
+                lines.append(f'{frame};{function_name} {round(elapsed * 1e6)}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        self.commands.clear()
+        self.functions.clear()
+        self._labels.clear()
+        self._command_functions.clear()
+        self._instrumented.clear()
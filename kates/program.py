@@ -0,0 +1,18 @@
+from . import compiler
+from . import runner
+
+from typing import Dict
+
+
+class Program:
+    def __init__(self, functions: Dict[str, runner.FunctionType], script: runner.Script, optimize: bool = False):
+        self.functions = runner.make_function_table(functions)
+        if optimize:
+            script = compiler.optimize(script, self.functions)
+        self.script = compiler.fuse(compiler.allocate_variables(compiler.link(script, self.functions)))
+
+    def spawn(self) -> runner.Runner:
+        return runner.Runner.from_program(self)
+
+    def __repr__(self) -> str:
+        return f'Program({self.script})'
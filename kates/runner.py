@@ -1,7 +1,10 @@
 from .error import Error
+from .symbols import symbol_table
 
 import abc
-from typing import Callable, Dict, List, Optional, NewType
+import inspect
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, NewType, Sequence, MutableMapping
 
 
 class NoSuchVariableError(Error):
@@ -42,6 +45,17 @@ class StrayEndifError(Error):
         return type(self) is type(other)
 
 
+class AwaitRequest(Error):
+    def __init__(self, function: 'AsyncFunctionType', arguments: Sequence[str], command_index: int):
+        super().__init__('Asynchronous function called outside of Runner.run_async')
+        self.function = function
+        self.arguments = arguments
+        self.command_index = command_index
+
+    def __eq__(self, other) -> bool:
+        return type(self) is type(other)
+
+
 class ScriptExecutionError(Error):
     def __init__(self, err, runner):
         super().__init__(f'Error raised while executing the script (command {runner.command_index+1}): {err}')
@@ -55,12 +69,16 @@ class ScriptExecutionError(Error):
 
 
 class Argument:
+    __slots__ = ()
+
     @abc.abstractmethod
     def evaluate(self, runner: 'Runner') -> str:
         ...
 
 
 class LiteralArgument(Argument):
+    __slots__ = ('value',)
+
     def __init__(self, value: str):
         self.value = value
 
@@ -78,6 +96,8 @@ class LiteralArgument(Argument):
 
 
 class VariableArgument(Argument):
+    __slots__ = ('variable_name',)
+
     def __init__(self, variable_name: str):
         self.variable_name = variable_name
 
@@ -96,6 +116,8 @@ class VariableArgument(Argument):
 
 
 class Command:
+    __slots__ = ()
+
     @abc.abstractmethod
     def run(self, runner: 'Runner') -> str:
         ...
@@ -105,15 +127,33 @@ class Command:
 
 
 class PlainCommand(Command):
+    __slots__ = ('function_name', 'arguments', 'values', 'evaluated')
+
     def __init__(self, function_name: str, arguments: List[Argument]):
         self.function_name = function_name
         self.arguments = arguments
+        # Literal arguments are evaluated once: `values` holds them, and only
+        # the (position, argument) pairs in `evaluated` are evaluated when the
+        # command is run. Without variables, `values` is passed as is
+        self.values = tuple([
+            argument.value if type(argument) is LiteralArgument else None
+            for argument in arguments
+        ])
+        self.evaluated = () if None not in self.values else tuple([
+            (position, argument)
+            for position, argument in enumerate(arguments)
+            if type(argument) is not LiteralArgument
+        ])
 
     def run(self, runner: 'Runner') -> str:
         if self.function_name not in runner.functions:
             raise NoSuchFunctionError(self.function_name)
         function = runner.functions[self.function_name]
-        arguments = [arg.evaluate(runner) for arg in self.arguments]
+        arguments = self.values
+        if self.evaluated:
+            arguments = list(arguments)
+            for position, argument in self.evaluated:
+                arguments[position] = argument.evaluate(runner)
         return function(runner, arguments)
 
     def __eq__(self, other) -> bool:
@@ -126,6 +166,8 @@ class PlainCommand(Command):
 
 
 class Assignment(Command):
+    __slots__ = ('variable_name', 'command')
+
     def __init__(self, variable_name: str, command: Command):
         self.variable_name = variable_name
         self.command = command
@@ -145,6 +187,8 @@ class Assignment(Command):
 
 
 class If(Command):
+    __slots__ = ('command',)
+
     def __init__(self, command: Command):
         self.command = command
 
@@ -167,6 +211,8 @@ class If(Command):
 
 
 class Else(Command):
+    __slots__ = ()
+
     def run(self, runner: 'Runner') -> str:
         runner.switch_no_execution_state()
         return ''
@@ -182,6 +228,8 @@ class Else(Command):
 
 
 class Endif(Command):
+    __slots__ = ()
+
     def run(self, runner: 'Runner') -> str:
         runner.pop_no_execution_state()
         return ''
@@ -196,62 +244,301 @@ class Endif(Command):
         return f'Endif'
 
 
+# Stateless commands are shared by all scripts
+ELSE = Else()
+ENDIF = Endif()
+EMPTY_LINE = PlainCommand('nop', [])
+
+
 class Script:
-    def __init__(self, commands: List[Command]):
+    variable_names: Sequence[str] = ()
+    variable_indices: Dict[str, int] = {}
+    _digest: Optional[bytes] = None
+
+    def __init__(self, commands: Sequence[Command]):
         self.commands = commands
 
     def __eq__(self, other):
         if type(self) != type(other):
             return False
-        return self.commands == other.commands
+        return list(self.commands) == list(other.commands)
 
     def __repr__(self) -> str:
         return f'Script({self.commands})'
 
 
-def builtin_id(runner: 'Runner', args: List[str]) -> str:
+def builtin_id(runner: 'Runner', args: Sequence[str]) -> str:
     if len(args) != 1:
         raise ArgumentsError()
     return args[0]
 
 
-def builtin_equals(runner: 'Runner', args: List[str]) -> str:
+def builtin_equals(runner: 'Runner', args: Sequence[str]) -> str:
     if len(args) != 2:
         raise ArgumentsError()
     return '1' if args[0] == args[1] else '0'
 
 
-def builtin_not_equals(runner: 'Runner', args: List[str]) -> str:
+def builtin_not_equals(runner: 'Runner', args: Sequence[str]) -> str:
     if len(args) != 2:
         raise ArgumentsError()
     return '0' if args[0] == args[1] else '1'
 
 
-def builtin_nop(runner: 'Runner', args: List[str]) -> str:
+def builtin_nop(runner: 'Runner', args: Sequence[str]) -> str:
     del args
     return ''
 
 
-FunctionType = Callable[['Runner', List[str]], str]
+FunctionType = Callable[['Runner', Sequence[str]], str]
+AsyncFunctionType = Callable[['Runner', Sequence[str]], Awaitable[str]]
 ExecutionStopReason = NewType('ExecutionStopReason', str)
+BUDGET_EXHAUSTED = ExecutionStopReason('budget')
+
+# With a deadline, the clock is only checked once in this many commands
+DEADLINE_CHECK_INTERVAL = 16
+
+
+unset = object()
+
+
+class AsyncFunction:
+    # Adapts a coroutine function to FunctionType. When called, it asks
+    # Runner.run_async to await the function and to run the command again,
+    # and on the second call it returns the awaited result
+    def __init__(self, function: AsyncFunctionType):
+        self.function = function
+
+    def __call__(self, runner: 'Runner', args: Sequence[str]) -> str:
+        result = runner._resumed_result
+        if result is not unset:
+            runner._resumed_result = unset
+            return result
+        raise AwaitRequest(self.function, args, runner.command_index - 1)
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return self.function == other.function
+
+    def __hash__(self) -> int:
+        return hash(self.function)
+
+    def __repr__(self) -> str:
+        return f'AsyncFunction({self.function})'
+
+
+class PureFunction:
+    # Marks a function whose result only depends on its arguments and which
+    # has no side effects, so kates.compiler.optimize can fold its calls on
+    # literals
+    def __init__(self, function: FunctionType):
+        self.function = function
+
+    def __call__(self, runner: 'Runner', args: Sequence[str]) -> str:
+        return self.function(runner, args)
+
+    def __eq__(self, other) -> bool:
+        if type(self) != type(other):
+            return False
+        return self.function == other.function
+
+    def __hash__(self) -> int:
+        return hash(self.function)
+
+    def __repr__(self) -> str:
+        return f'PureFunction({self.function})'
+
+
+def pure(function: FunctionType) -> PureFunction:
+    return PureFunction(function)
+
+
+builtin_functions: Dict[str, FunctionType] = {
+    '!=': builtin_not_equals,
+    '==': builtin_equals,
+    'id': builtin_id,
+    'nop': builtin_nop,
+}
+
+
+def is_pure(function: FunctionType) -> bool:
+    if type(function) is PureFunction:
+        return True
+    return any(function is builtin for builtin in builtin_functions.values())
+
+
+def make_function_table(functions: Dict[str, FunctionType]) -> Dict[str, FunctionType]:
+    # Names are shared with the ones in parsed scripts. Only the caller's
+    # functions are checked, the builtins are neither coroutines nor in need
+    # of interning
+    table = dict(builtin_functions)
+    for name, function in functions.items():
+        if inspect.iscoroutinefunction(function):
+            function = AsyncFunction(function)
+        table[symbol_table.intern(name)] = function
+    return table
+
+
+class VariableView(MutableMapping[str, str]):
+    def __init__(self, runner: 'Runner'):
+        self._indices = runner.script.variable_indices
+        self._runner = runner
+        self._extra: Dict[str, str] = {}
+
+    def __getitem__(self, name: str) -> str:
+        index = self._indices.get(name)
+        if index is None:
+            return self._extra[name]
+        value = self._runner.variable_slots[index]
+        if value is unset:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name: str, value: str):
+        index = self._indices.get(name)
+        if index is None:
+            self._extra[name] = value
+            return
+        runner = self._runner
+        if runner._shared_slots:
+            runner.own_variable_slots()
+        runner.variable_slots[index] = value
+
+    def __delitem__(self, name: str):
+        index = self._indices.get(name)
+        if index is None:
+            del self._extra[name]
+            return
+        runner = self._runner
+        if runner.variable_slots[index] is unset:
+            raise KeyError(name)
+        if runner._shared_slots:
+            runner.own_variable_slots()
+        runner.variable_slots[index] = unset
+
+    def __contains__(self, name) -> bool:
+        index = self._indices.get(name)
+        if index is None:
+            return name in self._extra
+        return self._runner.variable_slots[index] is not unset
+
+    def __iter__(self) -> Iterator[str]:
+        slots = self._runner.variable_slots
+        for name, index in self._indices.items():
+            if slots[index] is not unset:
+                yield name
+        yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(value is not unset for value in self._runner.variable_slots) + len(self._extra)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
 
 
 class Runner:
+    __slots__ = (
+        '_branch_depth',
+        '_hook',
+        '_resumed_result',
+        '_shared_slots',
+        '_suppressed_depth',
+        '_variables',
+        'command_index',
+        'execution_stop_reason',
+        'functions',
+        'script',
+        'used_steps',
+        'variable_slots',
+    )
+
     def __init__(self, functions: Dict[str, FunctionType], script: Script):
-        self._no_execution_stack = [False]
+        self._setup(make_function_table(functions), script)
+
+    @classmethod
+    def from_program(cls, program) -> 'Runner':
+        # Shares the program's function table and script instead of copying them
+        runner = cls.__new__(cls)
+        runner._setup(program.functions, program.script)
+        return runner
+
+    def _setup(self, functions: Dict[str, FunctionType], script: Script, variable_slots: Optional[List] = None):
+        self._hook = None
+        self._resumed_result = unset
+        self._branch_depth = 0
+        self._suppressed_depth: Optional[int] = None
         self.command_index = 0
         self.execution_stop_reason: Optional[ExecutionStopReason] = None
-        self.functions: Dict[str, FunctionType] = {
-            '!=': builtin_not_equals,
-            '==': builtin_equals,
-            'id': builtin_id,
-            'nop': builtin_nop,
-            **functions,
-        }
+        self.used_steps = 0
+        self.functions = functions
         self.script = script
-        self.variables: Dict[str, str] = {}
-
-    def run(self) -> ExecutionStopReason:
+        if variable_slots is None:
+            variable_slots = [unset] * len(script.variable_names)
+        self.variable_slots: List = variable_slots
+        self._shared_slots = False
+        self._variables: Optional[MutableMapping[str, str]] = None
+        if len(script.variable_names) == 0:
+            self._variables = {}
+
+    def fork(self) -> 'Runner':
+        # The fork shares variable slots with this runner until either of
+        # them writes to a slot. Variables of uncompiled scripts are copied
+        runner = type(self).__new__(type(self))
+        runner._setup(self.functions, self.script, self.variable_slots)
+        runner.command_index = self.command_index
+        runner._branch_depth = self._branch_depth
+        runner._suppressed_depth = self._suppressed_depth
+        runner._hook = self._hook
+        if len(self.script.variable_names) == 0:
+            runner._variables = dict(self.variables)
+            return runner
+
+        self._shared_slots = runner._shared_slots = True
+        if self._variables is not None and len(self._variables._extra) != 0:
+            runner.variables._extra.update(self._variables._extra)
+        return runner
+
+    def own_variable_slots(self):
+        self.variable_slots = list(self.variable_slots)
+        self._shared_slots = False
+
+    def snapshot(self) -> bytes:
+        from . import snapshot
+        return snapshot.snapshot(self)
+
+    @classmethod
+    def restore(cls, data: bytes, program) -> 'Runner':
+        from . import snapshot
+        return snapshot.restore(data, program)
+
+    def set_hook(self, hook):
+        # Replaces the class of the runner with one running an instrumented
+        # loop, or switches it back when `hook` is None
+        from . import tracing
+        tracing.install(self, hook)
+
+    @property
+    def variables(self) -> MutableMapping[str, str]:
+        # The view over variable slots is only created when someone asks for it
+        if self._variables is None:
+            self._variables = VariableView(self)
+        return self._variables
+
+    @variables.setter
+    def variables(self, variables: MutableMapping[str, str]):
+        if len(self.script.variable_names) == 0:
+            self._variables = variables
+            return
+        self.variable_slots = [unset] * len(self.variable_slots)
+        self._shared_slots = False
+        self._variables = None
+        self.variables.update(variables)
+
+    def run(self, max_steps: Optional[int] = None, deadline: Optional[float] = None) -> ExecutionStopReason:
+        # `deadline` is compared with time.monotonic()
+        if max_steps is not None or deadline is not None:
+            return self._run_limited(max_steps, deadline)
         while self.command_index < len(self.script.commands):
             self.run_single_command()
             if self.execution_stop_reason is not None:
@@ -259,22 +546,77 @@ class Runner:
                 return reason
         return ExecutionStopReason('end')
 
+    def _run_limited(self, max_steps: Optional[int], deadline: Optional[float]) -> ExecutionStopReason:
+        # The number of commands run is left in `used_steps`
+        commands = self.script.commands
+        steps = 0
+        try:
+            while self.command_index < len(commands):
+                if deadline is not None and time.monotonic() >= deadline:
+                    return BUDGET_EXHAUSTED
+                if max_steps is not None and steps >= max_steps:
+                    return BUDGET_EXHAUSTED
+                if max_steps is None:
+                    chunk = DEADLINE_CHECK_INTERVAL
+                elif deadline is None:
+                    chunk = max_steps - steps
+                else:
+                    chunk = min(max_steps - steps, DEADLINE_CHECK_INTERVAL)
+
+                for _ in range(chunk):
+                    if self.command_index >= len(commands):
+                        break
+                    steps += 1
+                    self.run_single_command()
+                    if self.execution_stop_reason is not None:
+                        reason, self.execution_stop_reason = self.execution_stop_reason, None
+                        return reason
+            return ExecutionStopReason('end')
+        finally:
+            self.used_steps = steps
+
+    async def run_async(self) -> ExecutionStopReason:
+        while True:
+            try:
+                return self.run()
+            except ScriptExecutionError as e:
+                if type(e.err) is not AwaitRequest:
+                    raise
+                request = e.err
+            try:
+                result = await request.function(self, request.arguments)
+            except Exception as e:
+                raise ScriptExecutionError(e, self) from e
+            self.command_index = request.command_index
+            self._resumed_result = result
+
+    # Only the outermost suppressed branch matters: nothing inside it can be
+    # executed until it is closed, so instead of a stack of states we keep the
+    # nesting depth and the depth at which execution was suppressed (if any)
+
     def push_no_execution_state(self, state: bool):
-        self._no_execution_stack.append(state)
+        self._branch_depth += 1
+        if state and self._suppressed_depth is None:
+            self._suppressed_depth = self._branch_depth
 
     def pop_no_execution_state(self):
-        if len(self._no_execution_stack) <= 1:
+        if self._branch_depth == 0:
             raise StrayEndifError()
-        self._no_execution_stack.pop()
+        if self._suppressed_depth == self._branch_depth:
+            self._suppressed_depth = None
+        self._branch_depth -= 1
 
     def get_no_execution_state(self):
-        return any(self._no_execution_stack)
+        return self._suppressed_depth is not None
 
     def switch_no_execution_state(self):
-        self._no_execution_stack[-1] = not self._no_execution_stack[-1]
+        if self._suppressed_depth is None:
+            self._suppressed_depth = self._branch_depth
+        elif self._suppressed_depth == self._branch_depth:
+            self._suppressed_depth = None
 
     def should_execute(self) -> bool:
-        return not self.get_no_execution_state()
+        return self._suppressed_depth is None
 
     def run_single_command(self):
         command = self.script.commands[self.command_index]
@@ -289,7 +631,8 @@ class Runner:
         if type(self) != type(other):
             return False
         return all((
-            self._no_execution_stack == other._no_execution_stack,
+            self._branch_depth == other._branch_depth,
+            self._suppressed_depth == other._suppressed_depth,
             self.command_index == other.command_index,
             self.execution_stop_reason == other.execution_stop_reason,
             self.functions == other.functions,
@@ -0,0 +1,132 @@
+from .runner import BUDGET_EXHAUSTED, ExecutionStopReason, FunctionType, Runner
+
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+
+
+SLEEP = ExecutionStopReason('sleep')
+WAIT = ExecutionStopReason('wait')
+END = ExecutionStopReason('end')
+
+
+class Scheduler:
+    def __init__(
+        self,
+        quantum: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.quantum = quantum
+        self.clock = clock
+        self._ready: Deque[Runner] = deque()
+        self._events: Dict[str, List[Runner]] = {}
+        self._timers: List[Tuple[float, int, Runner]] = []
+        self._sequence = itertools.count()
+        self._requests: Dict[int, Tuple[ExecutionStopReason, object]] = {}
+
+    def add(self, runner: Runner):
+        self._ready.append(runner)
+
+    def remove(self, runner: Runner):
+        def keep(other: Runner) -> bool:
+            return other is not runner
+
+        self._ready = deque(filter(keep, self._ready))
+        for event, runners in list(self._events.items()):
+            runners[:] = filter(keep, runners)
+            if len(runners) == 0:
+                del self._events[event]
+        self._timers = [timer for timer in self._timers if timer[2] is not runner]
+        heapq.heapify(self._timers)
+        self._requests.pop(id(runner), None)
+
+    def sleep(self, runner: Runner, seconds: float) -> str:
+        self._requests[id(runner)] = (SLEEP, self.clock() + seconds)
+        runner.execution_stop_reason = SLEEP
+        return ''
+
+    def wait(self, runner: Runner, event: str) -> str:
+        self._requests[id(runner)] = (WAIT, event)
+        runner.execution_stop_reason = WAIT
+        return ''
+
+    def notify(self, event: str):
+        self._ready.extend(self._events.pop(event, ()))
+
+    @property
+    def functions(self) -> Dict[str, FunctionType]:
+        return {
+            'sleep': lambda runner, args: self.sleep(runner, float(args[0])),
+            'wait': lambda runner, args: self.wait(runner, args[0]),
+        }
+
+    def next_wakeup(self) -> Optional[float]:
+        if len(self._timers) == 0:
+            return None
+        return self._timers[0][0]
+
+    @property
+    def ready_count(self) -> int:
+        return len(self._ready)
+
+    @property
+    def waiting_count(self) -> int:
+        return len(self._timers) + sum(map(len, self._events.values()))
+
+    def __len__(self) -> int:
+        return self.ready_count + self.waiting_count
+
+    def _wake_timers(self):
+        now = self.clock()
+        while len(self._timers) != 0 and self._timers[0][0] <= now:
+            self._ready.append(heapq.heappop(self._timers)[2])
+
+    def _run_slice(self, runner: Runner, steps: Optional[int]) -> Tuple[Optional[ExecutionStopReason], int]:
+        if steps is None:
+            return runner.run(), 0
+        # Delegating to runner.run keeps the behaviour of runners which
+        # override it, such as streaming and traced runners
+        reason = runner.run(max_steps=steps)
+        if reason == BUDGET_EXHAUSTED:
+            reason = None
+        return reason, runner.used_steps
+
+    def tick(self, budget: Optional[int] = None) -> List[Tuple[Runner, Union[ExecutionStopReason, Exception]]]:
+        # Runs every runner which is ready at the start of the tick, at most
+        # `quantum` commands each and at most `budget` commands in total.
+        # Returns the runners which have left the scheduler: the finished ones,
+        # the ones stopped for a reason the scheduler does not handle and the
+        # ones whose script raised an error, paired with the error, so one
+        # broken script does not stop the others
+        self._wake_timers()
+        left: List[Tuple[Runner, Union[ExecutionStopReason, Exception]]] = []
+        for _ in range(len(self._ready)):
+            if budget is not None and budget <= 0:
+                break
+            runner = self._ready.popleft()
+
+            steps = self.quantum
+            if budget is not None and (steps is None or steps > budget):
+                steps = budget
+            try:
+                reason, used = self._run_slice(runner, steps)
+            except Exception as e:
+                self._requests.pop(id(runner), None)
+                left.append((runner, e))
+                continue
+            if budget is not None:
+                budget -= used
+
+            request = self._requests.pop(id(runner), None)
+            if reason is None:
+                self._ready.append(runner)
+            elif request is not None and request[0] == reason:
+                if reason == SLEEP:
+                    heapq.heappush(self._timers, (request[1], next(self._sequence), runner))
+                else:
+                    self._events.setdefault(request[1], []).append(runner)
+            else:
+                left.append((runner, reason))
+        return left
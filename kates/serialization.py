@@ -0,0 +1,127 @@
+from . import compiler
+from . import runner
+from .error import Error
+
+import hashlib
+import marshal
+from typing import Any, List, Sequence, Tuple
+
+
+class SerializationError(Error):
+    pass
+
+
+_PLAIN = 0
+_ASSIGNMENT = 1
+_IF = 2
+_ELSE = 3
+_ENDIF = 4
+_BRANCH_UNLESS = 5
+_JUMP = 6
+_PASS = 7
+_SLOT_ASSIGNMENT = 8
+_CONSTANT = 9
+
+
+def dump_argument(argument: runner.Argument) -> Any:
+    if type(argument) is runner.LiteralArgument:
+        return argument.value
+    if type(argument) is runner.VariableArgument:
+        return (argument.variable_name,)
+    if type(argument) is compiler.SlotArgument:
+        return (argument.variable_name, argument.slot)
+    raise SerializationError(f'Cannot serialize argument: {argument}')
+
+
+def load_argument(data: Any) -> runner.Argument:
+    if type(data) is str:
+        return runner.LiteralArgument(data)
+    if len(data) == 2:
+        return compiler.SlotArgument(data[0], data[1])
+    return runner.VariableArgument(data[0])
+
+
+def dump_command(command: runner.Command) -> Tuple:
+    kind = type(command)
+    # Bound functions cannot be serialized, and fused instructions are stored
+    # unfused; the script can be linked again
+    if kind is runner.PlainCommand or kind is compiler.BoundCommand:
+        return (_PLAIN, command.function_name, tuple(map(dump_argument, command.arguments)))
+    if kind is runner.Assignment:
+        return (_ASSIGNMENT, command.variable_name, dump_command(command.command))
+    if isinstance(command, compiler.SlotAssignment):
+        return (_SLOT_ASSIGNMENT, command.variable_name, command.slot, dump_command(command.command))
+    if kind is runner.If:
+        return (_IF, dump_command(command.command))
+    if kind is runner.Else:
+        return (_ELSE,)
+    if kind is runner.Endif:
+        return (_ENDIF,)
+    if isinstance(command, compiler.BranchUnless):
+        return (_BRANCH_UNLESS, dump_command(command.command), command.target)
+    if kind is compiler.Jump:
+        return (_JUMP, command.target)
+    if kind is compiler.Pass:
+        return (_PASS,)
+    if kind is compiler.Constant:
+        return (_CONSTANT, command.value)
+    raise SerializationError(f'Cannot serialize command: {command}')
+
+
+def load_command(data: Tuple) -> runner.Command:
+    kind = data[0]
+    if kind == _PLAIN:
+        return runner.PlainCommand(data[1], list(map(load_argument, data[2])))
+    if kind == _ASSIGNMENT:
+        return runner.Assignment(data[1], load_command(data[2]))
+    if kind == _SLOT_ASSIGNMENT:
+        return compiler.SlotAssignment(data[1], data[2], load_command(data[3]))
+    if kind == _IF:
+        return runner.If(load_command(data[1]))
+    if kind == _ELSE:
+        return runner.ELSE
+    if kind == _ENDIF:
+        return runner.ENDIF
+    if kind == _BRANCH_UNLESS:
+        return compiler.BranchUnless(load_command(data[1]), data[2])
+    if kind == _JUMP:
+        return compiler.Jump(data[1])
+    if kind == _PASS:
+        return compiler.PASS
+    if kind == _CONSTANT:
+        return compiler.Constant(data[1])
+    raise SerializationError(f'Unknown command kind: {kind}')
+
+
+def dump_commands(commands: Sequence[runner.Command]) -> Tuple:
+    return tuple(map(dump_command, commands))
+
+
+def load_commands(data: Sequence[Tuple]) -> List[runner.Command]:
+    return list(map(load_command, data))
+
+
+def dumps(script: runner.Script) -> bytes:
+    # marshal keeps strings interned, so names and literals interned by the
+    # parser are interned again when loaded
+    compiled = isinstance(script, compiler.CompiledScript)
+    return marshal.dumps((compiled, dump_commands(script.commands), tuple(script.variable_names)))
+
+
+def loads(data: bytes) -> runner.Script:
+    try:
+        compiled, commands, variable_names = marshal.loads(data)
+        commands = load_commands(commands)
+    except (EOFError, ValueError, TypeError, IndexError) as e:
+        raise SerializationError(f'Invalid serialized script: {e}') from e
+    if compiled:
+        return compiler.CompiledScript(commands, variable_names)
+    return runner.Script(commands)
+
+
+def digest(script: runner.Script) -> bytes:
+    # Scripts are not changed after they are built, so the digest is cached
+    result = script._digest
+    if result is None:
+        result = script._digest = hashlib.blake2b(dumps(script), digest_size=16).digest()
+    return result
@@ -0,0 +1,100 @@
+from . import serialization
+from .error import Error
+from .runner import Runner, unset
+
+import marshal
+import struct
+from typing import Union
+
+
+SNAPSHOT_MAGIC = b'KATS'
+SNAPSHOT_FORMAT_VERSION = 1
+
+# magic, format version, script digest, command index, branch depth,
+# suppressed depth (-1 if execution is not suppressed)
+_HEADER = struct.Struct('<4sH16sqqq')
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class SnapshotError(Error):
+    pass
+
+
+def snapshot(runner: Runner) -> bytes:
+    slots = runner.variable_slots
+    values = tuple(None if value is unset else value for value in slots)
+    unset_slots = tuple(index for index, value in enumerate(slots) if value is unset)
+    if len(runner.script.variable_names) == 0:
+        extra = dict(runner.variables)
+    else:
+        # Variables unknown to the script are kept by the view, if it exists
+        extra = dict(runner.variables._extra) if runner._variables is not None else {}
+
+    suppressed_depth = runner._suppressed_depth
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_FORMAT_VERSION,
+        serialization.digest(runner.script),
+        runner.command_index,
+        runner._branch_depth,
+        -1 if suppressed_depth is None else suppressed_depth,
+    )
+    return header + marshal.dumps((values, unset_slots, extra))
+
+
+def read_digest(data: Buffer) -> bytes:
+    return _read_header(memoryview(data))[2]
+
+
+def _read_header(data: memoryview):
+    if len(data) < _HEADER.size:
+        raise SnapshotError('Snapshot is too short')
+    header = _HEADER.unpack_from(data)
+    if header[0] != SNAPSHOT_MAGIC:
+        raise SnapshotError('Not a snapshot')
+    if header[1] != SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f'Unsupported snapshot format version: {header[1]}')
+    return header
+
+
+def restore(data: Buffer, program) -> Runner:
+    # `program` is anything holding `functions` and `script`, like Program.
+    # The buffer itself is not copied, but marshal creates a new string for
+    # every value. Payloads may come from other nodes, so every value is
+    # checked to be a string before it gets into the runner
+    data = memoryview(data)
+    _, _, digest, command_index, branch_depth, suppressed_depth = _read_header(data)
+    if digest != serialization.digest(program.script):
+        raise SnapshotError('Snapshot was made for a different script')
+    try:
+        values, unset_slots, extra = marshal.loads(data[_HEADER.size:])
+    except (EOFError, ValueError, TypeError) as e:
+        raise SnapshotError(f'Invalid snapshot: {e}') from e
+    if type(values) is not tuple or type(unset_slots) is not tuple or type(extra) is not dict:
+        raise SnapshotError('Invalid snapshot: unexpected payload')
+    if len(values) != len(program.script.variable_names):
+        raise SnapshotError('Snapshot does not match the variables of the script')
+    unset_indices = set(unset_slots)
+    for index, value in enumerate(values):
+        if type(value) is not (type(None) if index in unset_indices else str):
+            raise SnapshotError(f'Invalid snapshot: value of {program.script.variable_names[index]} is not a string')
+    if not unset_indices.issubset(range(len(values))):
+        raise SnapshotError('Invalid snapshot: unset slot out of range')
+    for name, value in extra.items():
+        if type(name) is not str or type(value) is not str:
+            raise SnapshotError(f'Invalid snapshot: variable {name!r} is not a string')
+
+    runner = Runner.from_program(program)
+    runner.command_index = command_index
+    runner._branch_depth = branch_depth
+    runner._suppressed_depth = None if suppressed_depth < 0 else suppressed_depth
+    slots = list(values)
+    for index in unset_slots:
+        slots[index] = unset
+    runner.variable_slots = slots
+    if len(slots) == 0:
+        runner._variables = extra
+    elif len(extra) != 0:
+        runner.variables.update(extra)
+    return runner
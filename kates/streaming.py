@@ -0,0 +1,94 @@
+from . import parser
+from .runner import Command, ExecutionStopReason, FunctionType, Runner, Script
+
+import itertools
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class CommandWindow:
+    # The commands of a streaming script which have been fetched and not yet
+    # released. Indices stay the ones of the whole script, so command_index
+    # and the line numbers derived from it do not change when the executed
+    # prefix is deleted
+    def __init__(self):
+        self.offset = 0
+        self._commands: List[Command] = []
+
+    def __len__(self) -> int:
+        return self.offset + len(self._commands)
+
+    def __getitem__(self, index: int) -> Command:
+        if index < self.offset:
+            raise IndexError(f'Command {index} has been released')
+        return self._commands[index - self.offset]
+
+    def __iter__(self) -> Iterator[Command]:
+        return iter(self._commands)
+
+    def extend(self, commands: Iterable[Command]):
+        self._commands.extend(commands)
+
+    def release(self, before: int):
+        if before > self.offset:
+            del self._commands[:before - self.offset]
+            self.offset = before
+
+
+class StreamingScript(Script):
+    # Commands are pulled from `commands` in chunks, when the runner needs
+    # them. Scripts have no backward jumps, so commands which have already
+    # been executed can be released
+    def __init__(self, commands: Iterator[Command], chunk_size: int = 64):
+        super().__init__([])
+        self.commands: CommandWindow = CommandWindow()
+        self.chunk_size = chunk_size
+        self.exhausted = False
+        self._source = commands
+
+    def fetch(self) -> bool:
+        if self.exhausted:
+            return False
+        chunk = list(itertools.islice(self._source, self.chunk_size))
+        if len(chunk) == 0:
+            self.exhausted = True
+            return False
+        self.commands.extend(chunk)
+        return True
+
+    def release(self, before: int):
+        self.commands.release(before)
+
+    def __repr__(self) -> str:
+        return f'StreamingScript({len(self.commands)} commands fetched)'
+
+
+class StreamingRunner(Runner):
+    __slots__ = ()
+
+    def __init__(self, functions: Dict[str, FunctionType], lines: Iterable[str], chunk_size: int = 64):
+        super().__init__(functions, StreamingScript(parser.iter_parse(lines), chunk_size))
+
+    def run(self, max_steps: Optional[int] = None, deadline: Optional[float] = None) -> ExecutionStopReason:
+        # Parse errors are raised from here, when the runner gets to the
+        # broken line
+        limited = max_steps is not None or deadline is not None
+        used = 0
+        while True:
+            reason = super().run(None if max_steps is None else max_steps - used, deadline)
+            if limited:
+                used += self.used_steps
+                self.used_steps = used
+            if reason != 'end' or self.command_index < len(self.script.commands):
+                return reason
+            self.script.release(self.command_index)
+            if not self.script.fetch():
+                return reason
+
+    # Forks and snapshots would need the commands which the script releases
+    # once this runner has executed them
+
+    def fork(self) -> Runner:
+        raise TypeError('Streaming runners cannot be forked')
+
+    def snapshot(self) -> bytes:
+        raise TypeError('Streaming runners cannot be snapshotted')
@@ -0,0 +1,47 @@
+import sys
+
+
+class SymbolTable:
+    # Names and literals of all parsed scripts are shared through sys.intern,
+    # which also keeps them interned in serialized scripts and lets dict
+    # lookups of them in function tables and variable indices succeed on the
+    # identity check. Interned strings are freed once nothing uses them, so
+    # the table keeps no strings itself.
+    #
+    # With `counting` set, the table also counts how many copies were replaced
+    # by an already interned string. This is off by default, and `intern` is
+    # then sys.intern itself, since parsing calls it for every token
+    def __init__(self, counting: bool = False):
+        self.hits = 0
+        self.misses = 0
+        # Sizes of the equal copies which were replaced by a shared string
+        self.saved_bytes = 0
+        self.counting = counting
+
+    @property
+    def counting(self) -> bool:
+        return self.intern is not sys.intern
+
+    @counting.setter
+    def counting(self, counting: bool):
+        self.intern = self._intern_counted if counting else sys.intern
+
+    def _intern_counted(self, value: str) -> str:
+        result = sys.intern(value)
+        if result is value:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.saved_bytes += sys.getsizeof(value)
+        return result
+
+    def clear(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved_bytes = 0
+
+    def __repr__(self) -> str:
+        return f'SymbolTable({self.hits} hits, {self.misses} misses, {self.saved_bytes} bytes saved)'
+
+
+symbol_table = SymbolTable()
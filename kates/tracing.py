@@ -0,0 +1,77 @@
+from . import compiler
+from . import runner as runner_module
+from .runner import Command, ExecutionStopReason, Runner
+
+import time
+from typing import Optional
+
+
+class Hook:
+    def command_start(self, runner: Runner, index: int, command: Command):
+        pass
+
+    def command_end(self, runner: Runner, index: int, command: Command):
+        pass
+
+    def assignment(self, runner: Runner, variable_name: str, value: str):
+        pass
+
+    def branch(self, runner: Runner, index: int, taken: bool):
+        pass
+
+    def stop(self, runner: Runner, reason: ExecutionStopReason):
+        pass
+
+
+class TracedRunner(Runner):
+    # Runner.run is left without any checks for hooks; runners with a hook
+    # have their class switched to this one instead
+    __slots__ = ()
+
+    def run(self, max_steps: Optional[int] = None, deadline: Optional[float] = None) -> ExecutionStopReason:
+        hook = self._hook
+        commands = self.script.commands
+        steps = 0
+        while self.command_index < len(commands):
+            if max_steps is not None and steps >= max_steps:
+                return self._stop(hook, runner_module.BUDGET_EXHAUSTED, steps)
+            if deadline is not None and time.monotonic() >= deadline:
+                return self._stop(hook, runner_module.BUDGET_EXHAUSTED, steps)
+            steps += 1
+
+            index = self.command_index
+            command = commands[index]
+            if not (self.should_execute() or command.is_special()):
+                self.command_index += 1
+                continue
+            executing = self.should_execute()
+
+            hook.command_start(self, index, command)
+            self.run_single_command()
+            kind = type(command)
+            if kind is runner_module.Assignment:
+                hook.assignment(self, command.variable_name, self.variables[command.variable_name])
+            elif isinstance(command, compiler.SlotAssignment):
+                hook.assignment(self, command.variable_name, self.variable_slots[command.slot])
+            elif isinstance(command, compiler.BranchUnless):
+                hook.branch(self, index, self.command_index == index + 1)
+            elif kind is runner_module.If and executing:
+                hook.branch(self, index, self.should_execute())
+            hook.command_end(self, index, command)
+
+            if self.execution_stop_reason is not None:
+                reason, self.execution_stop_reason = self.execution_stop_reason, None
+                return self._stop(hook, reason, steps)
+        return self._stop(hook, ExecutionStopReason('end'), steps)
+
+    def _stop(self, hook: Hook, reason: ExecutionStopReason, steps: int) -> ExecutionStopReason:
+        self.used_steps = steps
+        hook.stop(self, reason)
+        return reason
+
+
+def install(runner: Runner, hook: Optional[Hook]):
+    if type(runner) not in (Runner, TracedRunner):
+        raise TypeError(f'Hooks are not supported by {type(runner).__name__}')
+    runner._hook = hook
+    runner.__class__ = Runner if hook is None else TracedRunner
@@ -0,0 +1,99 @@
+from kates.batch import BatchResultsError, batched, run_batch
+from kates.parser import parse
+from kates.program import Program
+from kates.runner import *
+
+import pytest
+
+
+def test_run_batch():
+    calls = []
+
+    @batched
+    def damage(runners, args):
+        calls.append(len(runners))
+        return [str(int(attack) - int(armor)) for attack, armor in args]
+
+    def stop(runner, args):
+        runner.execution_stop_reason = args[0]
+
+    program = Program({'damage': damage, 'stop': stop}, Script(parse('''
+        hp = damage $attack $armor
+        if == $hp 0
+            result = id blocked
+        else
+            result = id hit
+            if == $attack 99
+                stop critical
+            endif
+        endif
+        total = damage $hp 0
+    '''.strip())))
+
+    variable_sets = [
+        {'attack': '10', 'armor': '10'},
+        {'attack': '12', 'armor': '10'},
+        {'attack': '99', 'armor': '9'},
+        {'attack': '15', 'armor': '10'},
+    ]
+    results = run_batch(program, variable_sets)
+
+    assert calls == [4, 3]
+    assert [reason for _, reason in results] == ['end', 'end', 'critical', 'end']
+    assert [runner.variables.get('result') for runner, _ in results] == ['blocked', 'hit', 'hit', 'hit']
+    assert [runner.variables.get('total') for runner, _ in results] == ['0', '2', None, '5']
+
+    # A runner left by run_batch can be resumed on its own
+    runner = results[2][0]
+    assert runner.run() == 'end'
+    assert runner.variables['total'] == '90'
+    assert calls == [4, 3, 1]
+
+
+def test_batched_function_outside_of_batch():
+    double = batched(lambda runners, args: [arg[0] * 2 for arg in args])
+    runner = Runner({'double': double}, Script(parse('x = double ab')))
+    assert runner.run() == 'end'
+    assert runner.variables == {'x': 'abab'}
+
+
+def test_errors():
+    program = Program({}, Script(parse('x = id $y')))
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        run_batch(program, [{'y': '1'}, {}])
+    assert exc_info.value.err == NoSuchVariableError('y')
+
+
+def test_batched_conditions_and_calls():
+    calls = []
+
+    @batched
+    def check(runners, args):
+        calls.append([arg[0] for arg in args])
+        return [arg[0] for arg in args]
+
+    program = Program({'check': check}, Script(parse('''
+        if check $x
+            check yes
+        endif
+        check $missing
+    '''.strip())))
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        run_batch(program, [{'x': '1'}, {'x': '0'}, {'x': '1'}])
+    assert exc_info.value.err == NoSuchVariableError('missing')
+    assert calls == [['1', '0', '1'], ['yes', 'yes']]
+
+
+def test_batched_function_errors():
+    def fail(runners, args):
+        raise ValueError('broken')
+
+    program = Program({'f': batched(fail)}, Script(parse('y = f $x')))
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        run_batch(program, [{'x': '1'}, {'x': '2'}])
+    assert type(exc_info.value.err) is ValueError
+
+    program = Program({'f': batched(lambda runners, args: ['1'])}, Script(parse('y = f $x')))
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        run_batch(program, [{'x': '1'}, {'x': '2'}])
+    assert exc_info.value.err == BatchResultsError(2, 1)
@@ -0,0 +1,423 @@
+from kates.compiler import *
+from kates.parser import parse
+from kates.program import Program
+from kates.runner import *
+
+import pytest
+
+
+def test_jump_targets():
+    script = Script(parse('''
+        a
+        if b
+            c
+        else
+            d
+        endif
+        e
+    '''.strip()))
+    result = compile_script(script)
+    ground_truth = CompiledScript([
+        PlainCommand('a', []),
+        BranchUnless(PlainCommand('b', []), 4),
+        PlainCommand('c', []),
+        Jump(6),
+        PlainCommand('d', []),
+        Pass(),
+        PlainCommand('e', []),
+    ])
+    assert result == ground_truth
+    assert compile_script(result) is result
+
+
+def test_nested_branches():
+    a = []
+
+    def append(runner, args):
+        del runner
+        assert len(args) == 1
+        a.append(args[0])
+
+    true = lambda r, a: '1'
+    false = lambda r, a: '0'
+
+    script = compile_script(Script(parse('''
+        append .
+        if cond1
+            append 1
+            if cond2
+                append 2
+            else
+                append 3
+            endif
+            append 4
+        else
+            append 5
+            if cond2
+                append 6
+            else
+                append 7
+            endif
+            append 8
+        endif
+        append 9
+    '''.strip())))
+
+    for cond1 in (false, true):
+        for cond2 in (false, true):
+            functions = {'append': append, 'cond1': cond1, 'cond2': cond2}
+            assert Runner(functions, script).run() == 'end'
+
+    assert ''.join(a) == '.5789.5689.1349.1249'
+
+
+def test_skipped_branch_is_not_visited():
+    visited = []
+
+    def visit(runner, args):
+        del args
+        visited.append(runner.command_index)
+        return '0'
+
+    script = compile_script(Script(parse('\n'.join(
+        ['if visit'] + ['visit'] * 1000 + ['endif', 'visit']
+    ))))
+
+    runner = Runner({'visit': visit}, script)
+    assert runner.run() == 'end'
+    assert visited == [1, 1003]
+
+
+def test_unmatched_if_and_multiple_elses():
+    a = []
+
+    def append(runner, args):
+        del runner
+        a.append(args[0])
+
+    functions = {'append': append, 'false': lambda r, a: '0'}
+
+    script = compile_script(Script(parse('''
+        if false
+            append 1
+        else
+            append 2
+        else
+            append 3
+        else
+            append 4
+        endif
+        if false
+            append 5
+    '''.strip())))
+
+    assert Runner(functions, script).run() == 'end'
+    assert ''.join(a) == '24'
+
+
+def test_stray_else_and_endif():
+    a = []
+
+    def append(runner, args):
+        del runner
+        a.append(args[0])
+
+    script = compile_script(Script(parse('''
+        append 1
+        else
+        append 2
+        else
+        append 3
+    '''.strip())))
+
+    assert Runner({'append': append}, script).run() == 'end'
+    assert ''.join(a) == '13'
+
+    script = compile_script(Script(parse('''
+        else
+        append 4
+        endif
+    '''.strip())))
+
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        Runner({'append': append}, script).run()
+
+    assert isinstance(exc_info.value.err, StrayEndifError)
+    assert ''.join(a) == '13'
+
+
+def test_link():
+    a = []
+
+    def append(runner, args):
+        del runner
+        a.append(args[0])
+
+    script = link(Script(parse('''
+        x = id foo
+        if == $x foo
+            append $x
+        endif
+    '''.strip())), {'append': append})
+
+    assert script.commands[0] == Assignment('x', BoundCommand('id', [LiteralArgument('foo')], builtin_id))
+    assert script.commands[2] == BoundCommand('append', [VariableArgument('x')], append)
+
+    runner = Runner({}, script)
+    del runner.functions['id']
+    assert runner.run() == 'end'
+    assert a == ['foo']
+
+    assert link(script, {'append': a.append}).commands[2].function == a.append
+
+
+def test_link_unresolved():
+    script = Script(parse('''
+        foo
+        x = bar
+        if baz
+            foo
+        endif
+        nop
+    '''.strip()))
+
+    with pytest.raises(UnresolvedFunctionsError) as exc_info:
+        link(script, {})
+
+    assert exc_info.value.function_names == ['foo', 'bar', 'baz']
+    assert exc_info.value.locations == {'foo': [1, 4], 'bar': [2], 'baz': [3]}
+
+
+def test_allocate_variables():
+    a = []
+
+    def append(runner, args):
+        a.append((args[0], dict(runner.variables)))
+
+    def set_value(runner, args):
+        runner.variables[args[0]] = args[1]
+
+    script = allocate_variables(link(Script(parse('''
+        x = id foo
+        y = id $x
+        set z bar
+        set w baz
+        append $z
+    '''.strip())), {'append': append, 'set': set_value}))
+
+    assert script.variable_names == ('x', 'y', 'z')
+    assert script.commands[1] == SlotAssignment('y', 1, BoundCommand('id', [SlotArgument('x', 0)], builtin_id))
+    assert allocate_variables(script) is script
+
+    runner = Runner({}, script)
+    assert runner.run() == 'end'
+    assert a == [('bar', {'x': 'foo', 'y': 'foo', 'z': 'bar', 'w': 'baz'})]
+    assert runner.variable_slots == ['foo', 'foo', 'bar']
+
+    assert 'w' in runner.variables
+    del runner.variables['x']
+    del runner.variables['w']
+    assert runner.variables == {'y': 'foo', 'z': 'bar'}
+    assert len(runner.variables) == 2
+    with pytest.raises(KeyError):
+        runner.variables['x']
+    with pytest.raises(KeyError):
+        del runner.variables['x']
+
+
+def test_allocated_variable_errors():
+    script = allocate_variables(Script(parse('print $x\nx = id 1')))
+    runner = Runner({'print': lambda r, a: ''}, script)
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        runner.run()
+    assert exc_info.value.err == NoSuchVariableError('x')
+
+    runner = Runner({'print': lambda r, a: ''}, script)
+    runner.variables['x'] = '0'
+    assert runner.run() == 'end'
+    assert runner.variables['x'] == '1'
+
+
+def test_optimize_folds_literals():
+    double = pure(lambda runner, args: args[0] * 2)
+
+    def fail(runner, args):
+        raise ValueError()
+
+    script = Script(parse('''
+        x = == 1 1
+        y = != a a
+        z = id $x
+
+        double ab
+        w = double ab
+        v = fail
+        u = == 1
+        t = host 1
+    '''.strip()))
+    optimized = optimize(script, {'double': double, 'fail': pure(fail), 'host': lambda runner, args: ''})
+    assert optimized == Script([
+        Assignment('x', Constant('1')),
+        Assignment('y', Constant('0')),
+        Assignment('z', PlainCommand('id', [VariableArgument('x')])),
+        Assignment('w', Constant('abab')),
+        Assignment('v', PlainCommand('fail', [])),
+        Assignment('u', PlainCommand('==', [LiteralArgument('1')])),
+        Assignment('t', PlainCommand('host', [LiteralArgument('1')])),
+    ])
+
+    # Overridden builtins are only folded if they are pure
+    assert optimize(Script(parse('x = id 1')), {'id': lambda runner, args: ''}) == Script(parse('x = id 1'))
+
+    # Bound methods can be marked as pure too
+    class Host:
+        def upper(self, runner, args):
+            return args[0].upper()
+
+    optimized = optimize(Script(parse('x = upper ab')), {'upper': pure(Host().upper)})
+    assert optimized == Script([Assignment('x', Constant('AB'))])
+
+
+def test_optimize_compiled_scripts():
+    code = '''
+        if == 1 1
+            a = id 1
+        else
+            b
+        endif
+        if x
+            c = == $a 1
+        else
+        endif
+        endif
+    '''.strip()
+    expected = compile_script(optimize(Script(parse(code))))
+    assert optimize(compile_script(Script(parse(code)))) == expected
+    assert expected == compile_script(Script([
+        Assignment('a', Constant('1')),
+        If(PlainCommand('x', [])),
+        Assignment('c', PlainCommand('==', [VariableArgument('a'), LiteralArgument('1')])),
+        Else(),
+        Endif(),
+        Endif(),
+    ]))
+
+    functions = {'b': builtin_nop, 'x': lambda runner, args: '1'}
+    allocated = fuse(allocate_variables(link(Script(parse(code)), functions)))
+    optimized = optimize(allocated, functions)
+    assert type(optimized) is CompiledScript
+    assert optimized.variable_names == allocated.variable_names
+    assert [type(command) for command in optimized.commands] == [
+        SlotAssignment, BranchUnless, SlotAssignment, Jump, Pass, Endif,
+    ]
+
+
+def test_optimize_removes_constant_branches():
+    script = Script(parse('''
+        if == 1 1
+            a
+        else
+            b
+            if $x
+                c
+            else
+            endif
+        else
+            d
+        endif
+        if != 1 1
+            if == 1 1
+                e
+            else
+                f
+            endif
+        endif
+        if $x
+            if == a b
+                g
+            endif
+        else
+            h
+        endif
+        else
+        i
+        endif
+        if == 1 0
+            j
+    '''.strip()))
+    assert optimize(script) == Script(parse('''
+        a
+        d
+        if $x
+        else
+            h
+        endif
+        else
+        i
+        endif
+    '''.strip()))
+
+
+def test_optimized_program():
+    code = '''
+        x = id 1
+        if == $x 1
+            if == a a
+                append yes
+            else
+                append no
+            endif
+        endif
+        append $x
+    '''.strip()
+    a = []
+
+    def append(runner, args):
+        a.append(args[0])
+
+    program = Program({'append': append}, Script(parse(code)), optimize=True)
+    assert len(program.script.commands) == 5
+    assert program.spawn().run() == 'end'
+    assert a == ['yes', '1']
+
+    program = Program({'append': append}, compile_script(Script(parse(code))), optimize=True)
+    assert len(program.script.commands) == 5
+    assert program.spawn().run() == 'end'
+    assert a == ['yes', '1', 'yes', '1']
+
+
+def test_fuse():
+    host = lambda runner, args: '-'.join(args)
+    script = allocate_variables(link(Script(parse('''
+        a = host x $y
+        b = id $a
+        c = id 1
+        if == $b x-1
+            d = == $b 1
+        endif
+        if != 1 $b
+        endif
+        if == $b $a
+        endif
+    '''.strip())), {'host': host}))
+    fused = fuse(script)
+    assert [type(command) for command in fused.commands] == [
+        AssignCall, CopySlot, AssignCall, BranchUnlessEquals, AssignCall, Pass, BranchUnlessEquals, Pass,
+        BranchUnless, Pass,
+    ]
+    assert fused.variable_names == script.variable_names
+
+    # Transforming a fused script gives the unfused commands
+    assert CompiledScript([transform(command, lambda command: command) for command in fused.commands],
+                          fused.variable_names) == script
+
+    for y, expected in [('1', {'a': 'x-1', 'b': 'x-1', 'c': '1', 'd': '0'}), ('2', {'a': 'x-2', 'b': 'x-2', 'c': '1'})]:
+        runner = Runner({'host': host}, fused)
+        runner.variables['y'] = y
+        assert runner.run() == 'end'
+        assert {name: runner.variables[name] for name in 'abcd' if name in runner.variables} == expected
+
+    runner = Runner({}, fuse(allocate_variables(link(Script(parse('if == $x 1\nendif')), {}))))
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        runner.run()
+    assert exc_info.value.err == NoSuchVariableError('x')
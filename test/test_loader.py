@@ -0,0 +1,66 @@
+from kates.compiler import *
+from kates.parser import parse
+from kates.runner import *
+from kates import loader
+from kates import parser
+
+import os
+import pytest
+
+
+def forbid_parsing(monkeypatch):
+    def fail(code):
+        raise AssertionError('The script was parsed')
+    monkeypatch.setattr(parser, 'parse', fail)
+
+
+def test_load_script(tmp_path, monkeypatch):
+    path = tmp_path / 'test.kates'
+    path.write_text('a = id 1\nif == $a 1\n  b\nendif\n')
+    expected = compile_script(Script(parse(path.read_text())))
+
+    assert loader.load_script(path) == expected
+    assert os.path.exists(loader.cache_path(path))
+
+    with monkeypatch.context() as m:
+        forbid_parsing(m)
+        assert loader.load_script(path) == expected
+
+        # Touched, but not changed: the cache is validated by the source digest
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert loader.load_script(str(path)) == expected
+        assert loader.load_script(str(path)) == expected
+
+    path.write_text('c')
+    assert loader.load_script(path) == compile_script(Script(parse('c')))
+
+
+def test_invalid_cache(tmp_path):
+    path = tmp_path / 'test.kates'
+    path.write_text('a\nb')
+    expected = compile_script(Script(parse('a\nb')))
+
+    cache_path = loader.cache_path(path)
+    for contents in (b'', b'KATC', b'garbage' * 10):
+        with open(cache_path, 'wb') as f:
+            f.write(contents)
+        assert loader.load_script(path) == expected
+
+    with open(cache_path, 'rb') as f:
+        data = bytearray(f.read())
+    data[4] += 1
+    with open(cache_path, 'wb') as f:
+        f.write(data)
+    assert loader.load_script(path) == expected
+    with open(cache_path, 'rb') as f:
+        assert f.read()[4] == loader.CACHE_FORMAT_VERSION
+
+
+def test_parse_error(tmp_path):
+    path = tmp_path / 'test.kates'
+    path.write_text('a\nelse b')
+    with pytest.raises(parser.ParseError) as excinfo:
+        loader.load_script(path)
+    assert excinfo.value.line_number == 2
+    assert not os.path.exists(loader.cache_path(path))
@@ -0,0 +1,43 @@
+from kates.compiler import compile_script
+from kates.pack import Pack, PackError, write_pack
+from kates.parser import ParseError, parse
+from kates.runner import *
+
+import pytest
+
+
+def test_pack(tmp_path):
+    path = tmp_path / 'scripts.katespack'
+    scripts = {
+        'intro': 'player.disable_controls\nsay "Привет"',
+        'empty': '',
+        'broken': 'a\nelse b',
+    }
+    write_pack(path, scripts)
+
+    with Pack(path) as pack:
+        assert len(pack) == 3
+        assert list(pack) == ['intro', 'empty', 'broken']
+        assert 'intro' in pack and 'outro' not in pack
+        assert pack.loaded_count == 0
+
+        assert pack.source('intro') == scripts['intro']
+        intro = pack['intro']
+        assert intro == compile_script(Script(parse(scripts['intro'])))
+        assert pack['intro'] is intro
+        assert pack['empty'] == compile_script(Script(parse('')))
+        assert pack.loaded_count == 2
+
+        with pytest.raises(KeyError):
+            pack['outro']
+        with pytest.raises(ParseError) as excinfo:
+            pack['broken']
+        assert excinfo.value.line_number == 2
+
+
+def test_invalid_pack(tmp_path):
+    path = tmp_path / 'scripts.katespack'
+    for contents in (b'', b'KATP', b'XXXX' + bytes(10), b'KATP\x02\x00' + bytes(8), b'KATP\x01\x00\x05' + bytes(7) + b'\xff'):
+        path.write_bytes(contents)
+        with pytest.raises(PackError):
+            Pack(path)
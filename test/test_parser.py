@@ -3,6 +3,8 @@ from kates import parser
 from kates.runner import *
 
 import pytest
+import random
+import shlex
 
 
 def must_equal(a, b):
@@ -103,3 +105,116 @@ def test_variable():
         PlainCommand('a', [LiteralArgument('$$d')]),
     ]
     must_equal(result, ground_truth)
+
+
+def test_parse_cache():
+    cache = parser.ParseCache(maxsize=2)
+
+    a = cache.get('a 1\nb 2')
+    assert a == Script(parse('a 1\nb 2'))
+    assert type(a.commands) is tuple
+    assert cache.get('a 1\nb 2') is a
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    b = cache.get('b')
+    assert cache.get('a 1\nb 2') is a
+    cache.get('c')
+    assert len(cache) == 2
+    assert cache.get('a 1\nb 2') is a
+    assert cache.get('b') is not b
+    assert (cache.hits, cache.misses) == (3, 4)
+
+    cache.resize(1)
+    assert len(cache) == 1
+    assert cache.get('b') is cache.get('b')
+
+    cache.clear()
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 0)
+
+    with pytest.raises(ValueError):
+        parser.ParseCache(maxsize=-1)
+
+
+def test_parse_cached():
+    parser.parse_cache.clear()
+    script = parser.parse_cached('x = id foo')
+    assert parser.parse_cached('x = id foo') is script
+    assert (parser.parse_cache.hits, parser.parse_cache.misses) == (1, 1)
+
+    with pytest.raises(ParseError):
+        parser.parse_cached('else x')
+    assert len(parser.parse_cache) == 1
+
+
+def split_or_error(split, line):
+    try:
+        return split(line)
+    except ValueError as e:
+        return str(e)
+
+
+def test_split_line_matches_shlex():
+    cases = [
+        '',
+        '   ',
+        'a b\tc\r\nd',
+        'a  "b c"  d',
+        "a 'b \"c\" d' e",
+        'a "b \'c\' d" e',
+        'a"b c"d',
+        "'' \"\" x''y",
+        r'a\ b c',
+        r'"a\"b" "c\\d" "e\f"',
+        r"'a\b' 'c\\'",
+        r'\\\\ \$x \"',
+        'a "b',
+        "a 'b",
+        'a \\',
+        '"a \\',
+        '"a\\"b\\',
+        'a\x0bb c',
+    ]
+    for line in cases:
+        assert split_or_error(parser.split_line, line) == split_or_error(shlex.split, line), line
+
+    rng = random.Random(1)
+    alphabet = ['a', 'b', '$', ' ', '\t', '\r', '\n', '\x0b', "'", '"', '\\', '#']
+    for _ in range(20000):
+        line = ''.join(rng.choice(alphabet) for _ in range(rng.randrange(12)))
+        assert split_or_error(parser.split_line, line) == split_or_error(shlex.split, line), repr(line)
+
+
+def test_quoted_tokens():
+    result = parse('say "Hello, world!" \'$x\' "" a\\ b')
+    ground_truth = [
+        PlainCommand('say', [
+            LiteralArgument('Hello, world!'),
+            VariableArgument('x'),
+            LiteralArgument(''),
+            LiteralArgument('a b'),
+        ]),
+    ]
+    must_equal(result, ground_truth)
+
+    with pytest.raises(ParseError) as excinfo:
+        parse('a\nsay "unterminated')
+    assert excinfo.value.line_number == 2
+
+
+def test_compact_commands():
+    first = parse(''.join(['x = game.', 'spawn a $y\n', 'if == 1 1\nelse\nendif\n']))
+    second = parse(''.join(['x = game.', 'spawn a $y\n', 'if == 1 1\nelse\nendif\n']))
+    assert first == second
+
+    # Stateless commands are shared, names and literals are interned
+    assert first[2] is second[2] is ELSE
+    assert first[3] is second[3] is ENDIF
+    assert first[4] is second[4] is EMPTY_LINE
+    assert first[0].variable_name is second[0].variable_name
+    assert first[0].command.function_name is second[0].command.function_name
+    assert first[0].command.arguments[0].value is second[0].command.arguments[0].value
+    assert first[0].command.arguments[1].variable_name is second[0].command.arguments[1].variable_name
+
+    for command in [first[0], first[0].command, first[0].command.arguments[0], first[1], ELSE, ENDIF]:
+        assert not hasattr(command, '__dict__')
@@ -0,0 +1,39 @@
+from kates.parser import parse
+from kates.pool import TaskError, resolve_function, run_many
+from kates.runner import *
+
+import pytest
+
+
+def test_resolve_function():
+    assert resolve_function('kates.runner:builtin_id') is builtin_id
+    assert resolve_function('kates.runner:Runner.run') is Runner.run
+
+
+def test_run_many():
+    first = Script(parse('''
+        x = eq $a $b
+        if id $x
+            y = id same
+        else
+            y = id different
+        endif
+    '''.strip()))
+    second = Script(parse('z = id $a'))
+
+    tasks = [(first, {'a': str(i % 3), 'b': '1'}) for i in range(20)] + [(second, {'a': 'foo'})]
+    results = run_many(tasks, {'eq': 'kates.runner:builtin_equals'}, processes=2, chunksize=3)
+
+    assert len(results) == 21
+    for i, (reason, variables) in enumerate(results[:20]):
+        assert reason == 'end'
+        assert variables['y'] == ('same' if i % 3 == 1 else 'different')
+    assert results[20] == ('end', {'a': 'foo', 'z': 'foo'})
+
+
+def test_errors():
+    tasks = [(Script(parse('x = id $a')), {'a': '1'}), (Script(parse('x = id $a')), {})]
+    with pytest.raises(TaskError) as exc_info:
+        run_many(tasks, {}, processes=2)
+    assert exc_info.value.task_index == 1
+    assert 'No such variable' in exc_info.value.message
@@ -0,0 +1,103 @@
+from kates.compiler import AssignCall
+from kates.parser import parse
+from kates.profiler import Profiler
+from kates.program import Program
+from kates.runner import *
+from kates.streaming import StreamingRunner
+from kates.tracing import Hook
+
+import pytest
+
+
+class Clock:
+    # Every reading of the clock advances it by one second, and host
+    # functions advance it by ten more
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        self.now += 1.0
+        return self.now
+
+
+def make_functions(clock):
+    def work(runner, args):
+        clock.now += 10.0
+        return args[0]
+
+    def stop(runner, args):
+        runner.execution_stop_reason = 'stop'
+
+    return {'work': work, 'stop': stop}
+
+
+CODE = '''
+x = work 1
+if == $x 1
+    work 2
+    stop
+endif
+'''.strip()
+
+
+def test_profile_program():
+    clock = Clock()
+    profiler = Profiler(clock)
+    program = Program(make_functions(clock), Script(parse(CODE)))
+    runner = program.spawn()
+
+    assert profiler.run(runner, 'test') == 'stop'
+    assert profiler.run(runner, 'test') == 'end'
+    assert runner.functions is program.functions
+    assert runner.script is program.script
+    assert runner.variables['x'] == '1'
+
+    # Each command reads the clock twice itself and twice in each function
+    assert profiler.commands['test', 0].count == 1
+    assert profiler.commands['test', 0].cumulative_time == 13.0
+    assert profiler.commands['test', 0].self_time == 2.0
+    assert profiler.commands['test', 4].count == 1
+    assert profiler.functions['work'].count == 2
+    assert profiler.functions['work'].cumulative_time == 22.0
+    # The fused comparison does not call the builtin
+    assert '==' not in profiler.functions
+    assert profiler.functions['stop'].count == 1
+
+    report = profiler.report()
+    lines = report.split('\n')
+    assert lines[1].endswith('test:1: x = work')
+    assert 'test:2: if ==' in report
+    assert lines[lines.index('') + 2].endswith('work')
+
+    collapsed = profiler.collapsed().split('\n')
+    assert 'test;1:_x_=_work 2000000' in collapsed
+    assert 'test;1:_x_=_work;work 11000000' in collapsed
+
+    instrumented = profiler._instrument(program.script)
+    assert [type(command) for command in instrumented.commands] == [
+        type(command) for command in program.script.commands
+    ]
+    assert type(instrumented.commands[0]) is AssignCall
+
+    profiler.clear()
+    assert profiler.commands == {} and profiler.functions == {}
+
+
+def test_profile_runner():
+    clock = Clock()
+    profiler = Profiler(clock)
+    runner = Runner(make_functions(clock), Script(parse(CODE)))
+    assert profiler.run(runner) == 'stop'
+    assert runner.run() == 'end'
+    assert profiler.functions['work'].count == 2
+    assert ('script', 4) not in profiler.commands
+
+
+def test_unsupported_runner():
+    profiler = Profiler()
+    with pytest.raises(TypeError):
+        profiler.run(StreamingRunner({}, ['nop']))
+    runner = Runner({}, Script(parse('nop')))
+    runner.set_hook(Hook())
+    with pytest.raises(TypeError):
+        profiler.run(runner)
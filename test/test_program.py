@@ -0,0 +1,101 @@
+from kates.compiler import UnresolvedFunctionsError
+from kates.parser import parse
+from kates.program import Program
+from kates.runner import *
+
+import asyncio
+import pytest
+
+
+def test_spawn():
+    a = []
+
+    def append(runner, args):
+        a.append(args[0])
+
+    program = Program({'append': append}, Script(parse('''
+        x = id $start
+        append $x
+    '''.strip())))
+
+    first = program.spawn()
+    second = program.spawn()
+    assert first.functions is second.functions is program.functions
+    assert first.script is second.script is program.script
+    assert not hasattr(first, '__dict__')
+
+    first.variables['start'] = '1'
+    second.variables = {'start': '2'}
+    assert first.run() == 'end'
+    assert second.run() == 'end'
+    assert a == ['1', '2']
+    assert first.variables == {'start': '1', 'x': '1'}
+    assert second.variables == {'start': '2', 'x': '2'}
+
+    second.variables = {}
+    assert second.variables == {}
+
+
+def test_unresolved_functions():
+    with pytest.raises(UnresolvedFunctionsError) as exc_info:
+        Program({}, Script(parse('foo\nbar')))
+    assert exc_info.value.function_names == ['foo', 'bar']
+
+
+def test_legacy_runner_variables():
+    runner = Runner({}, Script(parse('x = id $y')))
+    variables = {'y': '1'}
+    runner.variables = variables
+    assert runner.run() == 'end'
+    assert variables == {'x': '1', 'y': '1'}
+
+
+def test_async_functions():
+    async def fetch(runner, args):
+        return args[0]
+
+    program = Program({'fetch': fetch}, Script(parse('x = fetch 1\ny = id $x')))
+    runner = program.spawn()
+    assert asyncio.run(runner.run_async()) == 'end'
+    assert runner.variables == {'x': '1', 'y': '1'}
+
+
+def test_fork():
+    def stop(runner, args):
+        runner.execution_stop_reason = 'stop'
+
+    program = Program({'stop': stop}, Script(parse('''
+        a = id 1
+        if == $a 1
+            stop
+            b = id $choice
+        endif
+        c = id $b
+    '''.strip())))
+
+    parent = program.spawn()
+    parent.variables['unknown'] = 'u'
+    assert parent.run() == 'stop'
+
+    first = parent.fork()
+    second = parent.fork()
+    assert first.variable_slots is parent.variable_slots
+    assert first.functions is parent.functions and first.script is parent.script
+
+    first.variables['choice'] = 'x'
+    second.variables['choice'] = 'y'
+    assert first.variable_slots is not parent.variable_slots
+    assert 'choice' not in parent.variables
+
+    assert first.run() == 'end'
+    assert second.run() == 'end'
+    assert first.variables == {'a': '1', 'choice': 'x', 'b': 'x', 'c': 'x', 'unknown': 'u'}
+    assert second.variables == {'a': '1', 'choice': 'y', 'b': 'y', 'c': 'y', 'unknown': 'u'}
+
+    third = parent.fork()
+    parent.variables['choice'] = 'z'
+    assert parent.run() == 'end'
+    assert parent.variables['c'] == 'z'
+    with pytest.raises(ScriptExecutionError):
+        third.run()
+    assert third.variables == {'a': '1', 'unknown': 'u'}
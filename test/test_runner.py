@@ -1,6 +1,8 @@
 from kates.runner import *
 
+import asyncio
 import pytest
+import time
 
 
 def test_simple():
@@ -246,3 +248,198 @@ def test_stray_endif():
         Runner({}, script).run()
 
     assert isinstance(exc_info.value.err, StrayEndifError)
+
+
+def test_deeply_nested_if():
+    a = []
+
+    def append(runner, args):
+        del runner
+        assert len(args) == 1
+        nonlocal a
+        a.append(args[0])
+
+    true = lambda r, a: '1'
+    false = lambda r, a: '0'
+
+    depth = 100
+    script = Script(
+        [If(PlainCommand('true', []))] * depth
+        + [
+            If(PlainCommand('false', [])),
+                If(PlainCommand('true', [])),
+                    PlainCommand('append', [LiteralArgument('1')]),
+                Else(),
+                    PlainCommand('append', [LiteralArgument('2')]),
+                Endif(),
+            Else(),
+                PlainCommand('append', [LiteralArgument('3')]),
+            Endif(),
+        ]
+        + [Endif()] * depth
+        + [
+            PlainCommand('append', [LiteralArgument('4')]),
+            Endif(),
+        ]
+    )
+
+    runner = Runner({'append': append, 'true': true, 'false': false}, script)
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        runner.run()
+
+    assert isinstance(exc_info.value.err, StrayEndifError)
+    assert ''.join(a) == '34'
+
+
+def test_run_async():
+    a = []
+
+    def append(runner, args):
+        del runner
+        a.append(args[0])
+
+    async def fetch(runner, args):
+        del runner
+        await asyncio.sleep(0)
+        return args[0]
+
+    async def stop(runner, args):
+        runner.execution_stop_reason = args[0]
+        return ''
+
+    functions = {'append': append, 'fetch': fetch, 'stop': stop}
+    script = Script([
+        Assignment('x', PlainCommand('fetch', [LiteralArgument('foo')])),
+        PlainCommand('append', [VariableArgument('x')]),
+        If(PlainCommand('fetch', [LiteralArgument('0')])),
+            PlainCommand('append', [LiteralArgument('1')]),
+        Else(),
+            PlainCommand('append', [LiteralArgument('2')]),
+        Endif(),
+        PlainCommand('stop', [LiteralArgument('S')]),
+        PlainCommand('append', [LiteralArgument('3')]),
+    ])
+
+    async def main():
+        runners = [Runner(functions, script) for _ in range(3)]
+        reasons = await asyncio.gather(*(runner.run_async() for runner in runners))
+        assert reasons == ['S'] * 3
+        assert await runners[0].run_async() == 'end'
+
+    asyncio.run(main())
+    assert a == ['foo'] * 3 + ['2'] * 3 + ['3']
+
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        Runner(functions, script).run()
+    assert isinstance(exc_info.value.err, AwaitRequest)
+
+
+def test_run_async_errors():
+    async def fail(runner, args):
+        raise ValueError('fail')
+
+    runner = Runner({'fail': fail}, Script([PlainCommand('fail', [])]))
+    with pytest.raises(ScriptExecutionError) as exc_info:
+        asyncio.run(runner.run_async())
+    assert isinstance(exc_info.value.err, ValueError)
+
+
+def test_max_steps():
+    a = []
+
+    def append(runner, args):
+        del runner
+        a.append(args[0])
+
+    def stop(runner, args):
+        runner.execution_stop_reason = args[0]
+
+    script = Script(
+        [PlainCommand('append', [LiteralArgument(str(i))]) for i in range(5)]
+        + [PlainCommand('stop', [LiteralArgument('S')])]
+        + [PlainCommand('append', [LiteralArgument('5')])]
+    )
+
+    runner = Runner({'append': append, 'stop': stop}, script)
+    assert runner.run(max_steps=2) == BUDGET_EXHAUSTED
+    assert a == ['0', '1']
+    assert runner.run(max_steps=0) == BUDGET_EXHAUSTED
+    assert runner.run(max_steps=10) == 'S'
+    assert a == ['0', '1', '2', '3', '4']
+    assert runner.run(max_steps=1) == 'end'
+    assert a == ['0', '1', '2', '3', '4', '5']
+    assert runner.run(max_steps=1) == 'end'
+
+
+def test_deadline():
+    count = 0
+
+    def increment(runner, args):
+        nonlocal count
+        count += 1
+
+    script = Script([PlainCommand('increment', [])] * 100)
+
+    runner = Runner({'increment': increment}, script)
+    assert runner.run(deadline=time.monotonic() - 1) == BUDGET_EXHAUSTED
+    assert count == 0
+    assert runner.run(deadline=time.monotonic() + 60) == 'end'
+    assert count == 100
+
+    def slow(runner, args):
+        time.sleep(0.01)
+
+    runner = Runner({'slow': slow}, Script([PlainCommand('slow', [])] * 100))
+    assert runner.run(deadline=time.monotonic() + 0.05, max_steps=50) == BUDGET_EXHAUSTED
+    assert 0 < runner.command_index < 50
+    assert runner.run(max_steps=200) == 'end'
+
+
+def test_fork():
+    def stop(runner, args):
+        runner.execution_stop_reason = 'stop'
+
+    script = Script([
+        Assignment('x', PlainCommand('id', [LiteralArgument('1')])),
+        If(PlainCommand('==', [VariableArgument('x'), LiteralArgument('2')])),
+            PlainCommand('stop', []),
+        Else(),
+            PlainCommand('stop', []),
+            Assignment('x', PlainCommand('id', [VariableArgument('y')])),
+        Endif(),
+    ])
+
+    runner = Runner({'stop': stop}, script)
+    assert runner.run() == 'stop'
+    fork = runner.fork()
+    assert fork == runner
+
+    fork.variables['y'] = '3'
+    assert fork.run() == 'end'
+    assert fork.variables == {'x': '3', 'y': '3'}
+    assert runner.variables == {'x': '1'}
+
+
+def test_preevaluated_arguments():
+    calls = []
+
+    def record(runner, args):
+        calls.append(args)
+        return ''
+
+    script = Script([
+        PlainCommand('record', [LiteralArgument('a'), LiteralArgument('b')]),
+        PlainCommand('record', [LiteralArgument('a'), VariableArgument('x'), LiteralArgument('c')]),
+        PlainCommand('record', []),
+    ])
+    runner = Runner({'record': record}, script)
+    runner.variables['x'] = 'b'
+    assert runner.run() == 'end'
+    runner.command_index = 0
+    assert runner.run() == 'end'
+
+    assert calls[0] == ('a', 'b')
+    assert calls[0] is calls[3] is script.commands[0].values
+    assert calls[1] == ['a', 'b', 'c']
+    assert calls[1] is not calls[4]
+    assert calls[2] == ()
@@ -0,0 +1,147 @@
+from kates.parser import parse
+from kates.program import Program
+from kates.runner import *
+from kates.scheduler import Scheduler
+from kates.streaming import StreamingRunner
+from kates.tracing import Hook
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_program(scheduler, log, code):
+    def append(runner, args):
+        log.append(args[0])
+
+    def stop(runner, args):
+        runner.execution_stop_reason = args[0]
+
+    functions = {**scheduler.functions, 'append': append, 'stop': stop}
+    return Program(functions, Script(parse(code)))
+
+
+def test_events_and_timers():
+    clock = Clock()
+    scheduler = Scheduler(clock=clock)
+    log = []
+
+    sleeper = make_program(scheduler, log, 'append s1\nsleep 2\nappend s2').spawn()
+    waiter = make_program(scheduler, log, 'append w1\nwait door\nappend w2\nstop custom\nappend w3').spawn()
+    scheduler.add(sleeper)
+    scheduler.add(waiter)
+
+    assert scheduler.tick() == []
+    assert log == ['s1', 'w1']
+    assert (scheduler.ready_count, scheduler.waiting_count) == (0, 2)
+    assert scheduler.next_wakeup() == 2.0
+
+    clock.now = 1.0
+    assert scheduler.tick() == []
+    assert log == ['s1', 'w1']
+
+    scheduler.notify('window')
+    scheduler.notify('door')
+    assert scheduler.tick() == [(waiter, 'custom')]
+    assert log == ['s1', 'w1', 'w2']
+
+    clock.now = 2.0
+    assert scheduler.tick() == [(sleeper, 'end')]
+    assert log == ['s1', 'w1', 'w2', 's2']
+    assert len(scheduler) == 0
+
+    scheduler.add(waiter)
+    assert scheduler.tick() == [(waiter, 'end')]
+    assert log[-1] == 'w3'
+
+
+def test_budgets():
+    scheduler = Scheduler(quantum=3)
+    log = []
+
+    program = make_program(scheduler, log, '\n'.join(f'append {i}' for i in range(5)))
+    first = program.spawn()
+    second = program.spawn()
+    scheduler.add(first)
+    scheduler.add(second)
+
+    assert scheduler.tick() == []
+    assert log == ['0', '1', '2'] * 2
+
+    assert scheduler.tick(budget=1) == []
+    assert log[6:] == ['3']
+
+    left = scheduler.tick(budget=3)
+    assert left[0][0] is second and left[1][0] is first
+    assert log[7:] == ['3', '4', '4']
+    assert len(scheduler) == 0
+
+
+def test_remove():
+    clock = Clock()
+    scheduler = Scheduler(clock=clock)
+    log = []
+
+    program = make_program(scheduler, log, 'wait e\nsleep 1\nappend x')
+    runners = [program.spawn() for _ in range(3)]
+    for runner in runners:
+        scheduler.add(runner)
+    scheduler.remove(runners[2])
+    scheduler.tick()
+    scheduler.remove(runners[0])
+    scheduler.notify('e')
+    scheduler.tick()
+    assert scheduler.waiting_count == 1
+    scheduler.remove(runners[1])
+    assert len(scheduler) == 0
+    clock.now = 5.0
+    assert scheduler.tick() == []
+    assert log == []
+
+
+def test_errors():
+    scheduler = Scheduler()
+    log = []
+    broken = make_program(scheduler, log, 'sleep').spawn()
+    missing = Runner({}, Script(parse('missing')))
+    working = make_program(scheduler, log, 'append x').spawn()
+    for runner in [broken, missing, working]:
+        scheduler.add(runner)
+
+    left = scheduler.tick()
+    assert [runner for runner, _ in left] == [broken, missing, working]
+    assert type(left[0][1]) is ScriptExecutionError
+    assert type(left[0][1].err) is IndexError
+    assert left[1][1] == ScriptExecutionError(NoSuchFunctionError('missing'), missing)
+    assert left[2][1] == 'end'
+    assert log == ['x']
+    assert len(scheduler) == 0
+
+
+def test_overridden_run():
+    scheduler = Scheduler(quantum=2)
+    log = []
+
+    class Recorder(Hook):
+        def command_start(self, runner, index, command):
+            log.append(('start', index))
+
+    streaming = StreamingRunner(
+        make_program(scheduler, log, '').functions, [f'append {i}' for i in range(3)], chunk_size=2
+    )
+    traced = make_program(scheduler, log, 'append a\nappend b\nappend c').spawn()
+    traced.set_hook(Recorder())
+    scheduler.add(streaming)
+    scheduler.add(traced)
+
+    assert scheduler.tick() == []
+    assert log == ['0', '1', ('start', 0), 'a', ('start', 1), 'b']
+    assert streaming.used_steps == 2 and traced.used_steps == 2
+
+    left = scheduler.tick(budget=3)
+    assert left == [(streaming, 'end'), (traced, 'end')]
+    assert log[6:] == ['2', ('start', 2), 'c']
@@ -0,0 +1,42 @@
+from kates.compiler import *
+from kates.parser import parse
+from kates.runner import *
+from kates import serialization
+
+import pytest
+
+
+def test_roundtrip():
+    script = Script(parse('''
+        a $b $$c "d e"
+        x = id ''
+        if == $x 1
+            foo
+        else
+            bar
+        endif
+        endif
+    '''.strip()))
+
+    data = serialization.dumps(script)
+    assert type(data) is bytes
+    assert serialization.loads(data) == script
+
+    compiled = compile_script(script)
+    assert serialization.loads(serialization.dumps(compiled)) == compiled
+
+    allocated = allocate_variables(script)
+    loaded = serialization.loads(serialization.dumps(allocated))
+    assert loaded == allocated
+    assert loaded.variable_names == ('b', 'x')
+
+    optimized = optimize(script)
+    assert serialization.loads(serialization.dumps(optimized)) == optimized
+
+
+def test_invalid_data():
+    with pytest.raises(serialization.SerializationError):
+        serialization.loads(b'garbage')
+
+    with pytest.raises(serialization.SerializationError):
+        serialization.loads(serialization.dumps(Script([]))[:-1])
@@ -0,0 +1,122 @@
+from kates.parser import parse
+from kates.program import Program
+from kates.runner import *
+from kates.snapshot import SnapshotError, read_digest
+from kates import serialization
+
+import marshal
+import pytest
+
+
+def make_program(log):
+    def append(runner, args):
+        log.append(args[0])
+
+    def stop(runner, args):
+        runner.execution_stop_reason = 'stop'
+
+    return Program({'append': append, 'stop': stop}, Script(parse('''
+        x = id $start
+        if == $x 1
+            append one
+            stop
+            y = id $x
+        else
+            append other
+        endif
+        append $y
+    '''.strip())))
+
+
+def test_snapshot_and_restore():
+    log = []
+    program = make_program(log)
+    runner = program.spawn()
+    runner.variables['start'] = '1'
+    runner.variables['external'] = 'e'
+    assert runner.run() == 'stop'
+
+    data = runner.snapshot()
+    assert type(data) is bytes
+    assert read_digest(data) == serialization.digest(program.script)
+
+    # The same script built again elsewhere has the same digest
+    restored = Runner.restore(memoryview(data), make_program(log))
+    assert restored.command_index == runner.command_index
+    assert restored.variables == {'start': '1', 'x': '1', 'external': 'e'}
+    assert restored.run() == 'end'
+    assert log == ['one', '1']
+
+
+def test_legacy_runner():
+    log = []
+
+    def append(runner, args):
+        log.append(args[0])
+
+    def stop(runner, args):
+        runner.execution_stop_reason = 'stop'
+
+    functions = {'append': append, 'stop': stop}
+    script = Script(parse('''
+        if == $a 1
+            if == $a 2
+                append no
+            else
+                stop
+                append yes
+            endif
+        endif
+    '''.strip()))
+
+    runner = Runner(functions, script)
+    runner.variables['a'] = '1'
+    assert runner.run() == 'stop'
+
+    class Environment:
+        pass
+
+    environment = Environment()
+    environment.functions = runner.functions
+    environment.script = Script(parse(''))
+    with pytest.raises(SnapshotError):
+        Runner.restore(runner.snapshot(), environment)
+
+    environment.script = script
+    restored = Runner.restore(runner.snapshot(), environment)
+    assert restored == runner
+    assert restored.run() == 'end'
+    assert log == ['yes']
+
+
+def test_invalid_snapshots():
+    program = make_program([])
+    data = program.spawn().snapshot()
+
+    with pytest.raises(SnapshotError):
+        Runner.restore(data[:10], program)
+    with pytest.raises(SnapshotError):
+        Runner.restore(b'XXXX' + data[4:], program)
+    with pytest.raises(SnapshotError):
+        Runner.restore(data[:4] + b'\xff\xff' + data[6:], program)
+    with pytest.raises(SnapshotError):
+        Runner.restore(data[:-1], program)
+
+
+def test_snapshot_value_types():
+    program = make_program([])
+    count = len(program.script.variable_names)
+    data = program.spawn().snapshot()
+    header = data[:len(data) - len(marshal.dumps(((None,) * count, tuple(range(count)), {})))]
+    assert Runner.restore(header + marshal.dumps((('1',) * count, (), {'z': '2'})), program).variables['z'] == '2'
+
+    for payload in [
+        ((1,) * count, (), {}),
+        (('1',) * count, (count,), {}),
+        ((None,) * count, (), {}),
+        ((None,) * count, tuple(range(count)), {'z': b'2'}),
+        ((None,) * count, tuple(range(count)), {1: '2'}),
+        ([None] * count, tuple(range(count)), {}),
+    ]:
+        with pytest.raises(SnapshotError):
+            Runner.restore(header + marshal.dumps(payload), program)
@@ -0,0 +1,90 @@
+from kates.parser import ParseError, iter_parse, parse
+from kates.runner import *
+from kates.streaming import StreamingRunner
+
+import io
+import pytest
+
+
+def test_iter_parse():
+    code = 'a\n\nif b\n  c $d\nendif\n'
+    assert list(iter_parse(io.StringIO(code))) == parse(code)
+    assert list(iter_parse(code.split('\n'))) == parse(code)
+    assert list(iter_parse([])) == parse('')
+
+    commands = iter_parse(io.StringIO('a\nb\nelse c\nd'))
+    assert next(commands) == PlainCommand('a', [])
+    assert next(commands) == PlainCommand('b', [])
+    with pytest.raises(ParseError) as excinfo:
+        next(commands)
+    assert excinfo.value.line_number == 3
+
+
+def test_streaming_runner():
+    log = []
+    lines_read = 0
+
+    def append(runner, args):
+        log.append((args[0], lines_read))
+
+    def stop(runner, args):
+        runner.execution_stop_reason = args[0]
+
+    def lines():
+        nonlocal lines_read
+        yield 'x = id 0'
+        for i in range(1, 100):
+            lines_read = i
+            yield f'if == $x {i % 2}'
+            yield f'    append {i}'
+            yield 'else'
+            yield '    x = id 1'
+            yield 'endif'
+        yield 'stop S'
+        yield 'append end'
+
+    runner = StreamingRunner({'append': append, 'stop': stop}, lines(), chunk_size=10)
+    assert runner.run() == 'S'
+    assert [value for value, _ in log] == [str(i) for i in range(3, 100, 2)]
+    # Execution started long before the whole script was parsed
+    assert log[0][1] < 10
+    # Executed commands are deleted, but indices stay the ones of the script
+    commands = runner.script.commands
+    assert commands.offset > 0 and len(list(commands)) <= 10
+    assert len(commands) == commands.offset + len(list(commands))
+    with pytest.raises(IndexError):
+        commands[0]
+
+    assert runner.run() == 'end'
+    assert log[-1][0] == 'end'
+
+
+def test_streaming_parse_error():
+    log = []
+    functions = {'append': lambda r, a: log.append(a[0])}
+    runner = StreamingRunner(functions, io.StringIO('append 1\nappend 2\nendif x\n'), chunk_size=1)
+    with pytest.raises(ParseError) as excinfo:
+        runner.run()
+    assert excinfo.value.line_number == 3
+    assert log == ['1', '2']
+
+
+def test_streaming_budget():
+    log = []
+    functions = {'append': lambda r, a: log.append(a[0])}
+    runner = StreamingRunner(functions, [f'append {i}' for i in range(10)], chunk_size=4)
+    assert runner.run(max_steps=3) == 'budget'
+    assert log == ['0', '1', '2']
+    # The budget is shared by all chunks the run goes through
+    assert runner.run(max_steps=5) == 'budget'
+    assert log == [str(i) for i in range(8)]
+    assert runner.run(max_steps=5) == 'end'
+    assert log == [str(i) for i in range(10)]
+
+
+def test_streaming_fork_and_snapshot():
+    runner = StreamingRunner({}, ['nop', 'nop'])
+    with pytest.raises(TypeError):
+        runner.fork()
+    with pytest.raises(TypeError):
+        runner.snapshot()
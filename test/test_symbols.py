@@ -0,0 +1,59 @@
+from kates.parser import parse
+from kates.runner import *
+from kates.symbols import SymbolTable, symbol_table
+
+import sys
+
+
+def test_symbol_table():
+    table = SymbolTable()
+    assert not table.counting
+    assert table.intern is sys.intern
+
+    table.counting = True
+    first = ''.join(['symbol ', 'table'])
+    second = ''.join(['symbol ', 'table'])
+    symbol = table.intern(first)
+    assert symbol == first
+    assert symbol is sys.intern(''.join(['symbol ', 'table']))
+    assert table.intern(second) is symbol
+    assert table.intern(symbol) is symbol
+    assert symbol is first
+    assert (table.hits, table.misses) == (1, 2)
+    assert table.saved_bytes == sys.getsizeof(symbol)
+
+    table.clear()
+    assert (table.hits, table.misses, table.saved_bytes) == (0, 0, 0)
+
+
+def test_parsed_scripts_share_symbols():
+    code = 'x = player.disable_controls $glow_sprite 40'
+    symbol_table.counting = True
+    try:
+        hits = symbol_table.hits
+        first = parse(''.join([code]))[0]
+        second = parse(''.join([code]))[0]
+        assert symbol_table.hits >= hits + 5
+    finally:
+        symbol_table.counting = False
+
+    assert first.variable_name is second.variable_name
+    assert first.command.function_name is second.command.function_name
+    assert first.command.arguments[0].variable_name is second.command.arguments[0].variable_name
+    assert first.command.arguments[1].value is second.command.arguments[1].value
+
+    # Function tables use the same strings as parsed scripts
+    functions = make_function_table({''.join(['player.', 'disable_controls']): builtin_nop})
+    assert any(name is first.command.function_name for name in functions)
+
+
+def test_unused_symbols_are_released():
+    def make_value() -> str:
+        return ''.join(['released ', 'literal'])
+
+    script = parse(f'f "{make_value()}"')
+    assert script[0].arguments[0].value is sys.intern(make_value())
+    del script
+
+    value = make_value()
+    assert sys.intern(value) is value
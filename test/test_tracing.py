@@ -0,0 +1,93 @@
+from kates.parser import parse
+from kates.program import Program
+from kates.runner import *
+from kates.streaming import StreamingRunner
+from kates.tracing import Hook, TracedRunner
+
+import pytest
+
+
+class Recorder(Hook):
+    def __init__(self):
+        self.events = []
+
+    def command_start(self, runner, index, command):
+        self.events.append(('start', index))
+
+    def command_end(self, runner, index, command):
+        self.events.append(('end', index))
+
+    def assignment(self, runner, variable_name, value):
+        self.events.append(('assign', variable_name, value))
+
+    def branch(self, runner, index, taken):
+        self.events.append(('branch', index, taken))
+
+    def stop(self, runner, reason):
+        self.events.append(('stop', reason))
+
+
+CODE = '''
+x = id 1
+if == $x 2
+    nop
+else
+    if == $x 1
+        stop
+    endif
+endif
+'''.strip()
+
+FUNCTIONS = {'stop': lambda runner, args: setattr(runner, 'execution_stop_reason', 'S')}
+
+
+def test_program_hooks():
+    runner = Program(FUNCTIONS, Script(parse(CODE))).spawn()
+    recorder = Recorder()
+    runner.set_hook(recorder)
+    assert type(runner) is TracedRunner
+
+    assert runner.run() == 'S'
+    assert recorder.events == [
+        ('start', 0), ('assign', 'x', '1'), ('end', 0),
+        ('start', 1), ('branch', 1, False), ('end', 1),
+        ('start', 4), ('branch', 4, True), ('end', 4),
+        ('start', 5), ('end', 5),
+        ('stop', 'S'),
+    ]
+
+    recorder.events.clear()
+    assert runner.run() == 'end'
+    assert recorder.events == [('start', 6), ('end', 6), ('start', 7), ('end', 7), ('stop', 'end')]
+
+    runner.set_hook(None)
+    assert type(runner) is Runner
+
+
+def test_runner_hooks():
+    runner = Runner(FUNCTIONS, Script(parse(CODE)))
+    recorder = Recorder()
+    runner.set_hook(recorder)
+
+    assert runner.run(max_steps=2) == BUDGET_EXHAUSTED
+    assert runner.run() == 'S'
+    assert recorder.events == [
+        ('start', 0), ('assign', 'x', '1'), ('end', 0),
+        ('start', 1), ('branch', 1, False), ('end', 1),
+        ('stop', 'budget'),
+        ('start', 3), ('end', 3),
+        ('start', 4), ('branch', 4, True), ('end', 4),
+        ('start', 5), ('end', 5),
+        ('stop', 'S'),
+    ]
+
+    fork = runner.fork()
+    assert type(fork) is TracedRunner
+    assert fork.run() == 'end'
+    assert recorder.events[-1] == ('stop', 'end')
+
+
+def test_unsupported_runner():
+    runner = StreamingRunner({}, ['nop'])
+    with pytest.raises(TypeError):
+        runner.set_hook(Recorder())